@@ -0,0 +1,41 @@
+"""
+Numerical kernels of the forecast pipeline.
+
+Plain NumPy array arithmetic: nothing is JIT-compiled, so there is no
+first-call compile cost, and importing this module does not load NumPy.
+"""
+from typing import TYPE_CHECKING, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+def poa_to_ac_kw(poa_global: "np.ndarray", temp_air: "np.ndarray", pdc0: float,
+                 gamma_pdc: float, inverter_efficiency: float) -> "np.ndarray":
+    """
+    PVWatts DC power of the plane-of-array irradiance, converted to AC kW.
+    
+    Cell temperature, temperature derate, DC power, inverter losses and the
+    W -> kW step are evaluated in place on one output array instead of
+    materializing a temporary per step. pdc0 may also be an array that
+    broadcasts against the inputs, e.g. one row per system.
+    """
+    # pdc = poa / 1000 * pdc0 * (1 + gamma * (t_cell - 25)), t_cell = t_air + 3
+    out = temp_air + (3.0 - 25.0)
+    out *= gamma_pdc
+    out += 1.0
+    out *= poa_global
+    out *= pdc0 * 0.001 * inverter_efficiency * 0.001
+    return out
+
+
+def bulk_energy(power_2d: "np.ndarray") -> Tuple[float, "np.ndarray"]:
+    """
+    Total and per-day energy in kWh of hourly kW values shaped (days, 24).
+    
+    Missing hours (NaN, no weather data) are skipped in both sums, so every
+    day gets a finite energy value as the response schema requires.
+    """
+    import numpy as np
+    
+    return float(np.nansum(power_2d)), np.nansum(power_2d, axis=1)
@@ -1,41 +1,132 @@
 import os
+import hmac
+import time
 import uuid
 import jwt
-from typing import Optional
+from cachetools import TLRUCache
+from functools import lru_cache
+from typing import Any, NamedTuple, Optional
 from sqlalchemy.orm import Session
-from ..database import get_db
 from ..models import User
+from ..queries import USER_BY_EMAIL
 from .auth_interface import AuthServiceInterface
 
 
+# Claims the gateway always issues; checked inside the single verified decode
+_REQUIRED_CLAIMS = {"require": ["sub", "exp"]}
+
+# Verified tokens are remembered for at most this many seconds (never past exp)
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 10_000
+
+
+def _token_ttu(_key, value, now):
+    """Expire a cached token at its exp claim or after TOKEN_CACHE_TTL, whichever is first"""
+    return min(value[1], now + TOKEN_CACHE_TTL)
+
+
+# token digest -> (user id, exp); shared by every request in the process
+_token_cache = TLRUCache(maxsize=TOKEN_CACHE_SIZE, ttu=_token_ttu, timer=time.time)
+
+
+# Prefix of the tokens accepted by MockAuthService
+_MOCK_PREFIX = "mock-token-for-"
+
+
+class _JWTConfig(NamedTuple):
+    secret: str
+    algorithm: str
+    algorithms: list
+    verify_key: Any
+    secret_bytes: bytes
+
+
+@lru_cache(maxsize=1)
+def _load_jwt_config() -> _JWTConfig:
+    """
+    Read JWT settings from the environment once per process.
+    
+    The verification key is prepared up front (secret encoded to bytes for
+    HMAC, PEM parsed into a key object for RSA/EC) so decoding never has to
+    re-derive it from the raw string.
+    """
+    jwt_secret = os.getenv("JWT_SECRET", "default-secret-key")
+    algorithm = os.getenv("ALGORITHM", "HS256")
+    verify_key = jwt.get_algorithm_by_name(algorithm).prepare_key(jwt_secret)
+    return _JWTConfig(jwt_secret, algorithm, [algorithm], verify_key, jwt_secret.encode())
+
+
+def _token_key(token: str, secret: bytes) -> bytes:
+    """
+    Cache key for a token: keyed by the JWT secret so rotating it invalidates
+    every entry, truncated to 16 bytes. hmac.digest() is the one-shot C path.
+    """
+    return hmac.digest(secret, token.encode(), "sha256")[:16]
+
+
+def _is_user_id(subject: str) -> bool:
+    """True if the subject has the canonical UUID form the service issues as user ids"""
+    try:
+        return str(uuid.UUID(subject)) == subject
+    except ValueError:
+        return False
+
+
 class JWTAuthService(AuthServiceInterface):
-    def __init__(self, db_session: Session = None):
-        self.db_session = db_session or next(get_db())
-        self.jwt_secret = os.getenv("JWT_SECRET", "default-secret-key")
-        self.algorithm = os.getenv("ALGORITHM", "HS256")
+    """Stateless JWT verifier; the request's DB session is passed per call"""
+
+    def __init__(self):
+        self._decode = jwt.decode
+    
+    @property
+    def jwt_secret(self) -> str:
+        return _load_jwt_config().secret
+    
+    @property
+    def algorithm(self) -> str:
+        return _load_jwt_config().algorithm
     
-    async def authenticate(self, token: str) -> Optional[User]:
+    async def authenticate(self, token: str, db_session: Session) -> Optional[User]:
         try:
+            config = _load_jwt_config()
+            cache_key = _token_key(token, config.secret_bytes)
+            cached = _token_cache.get(cache_key)
+            if cached is not None:
+                # Primary-key lookup is served from the session identity map when hot
+                user = db_session.get(User, cached[0])
+                if user is not None:
+                    return user
+            
             # JWT token validieren und payload extrahieren
-            payload = jwt.decode(token, self.jwt_secret, algorithms=[self.algorithm])
-            username = payload.get("sub")
+            payload = self._decode(
+                token,
+                config.verify_key,
+                algorithms=config.algorithms,
+                options=_REQUIRED_CLAIMS
+            )
+            subject = payload.get("sub")
             
-            if not username:
+            if not subject:
                 return None
-                
-            # Benutzer in lokaler DB finden
-            user = self.db_session.query(User).filter(User.email == username).first()
             
-            # Wenn Benutzer nicht existiert, neuen anlegen
-            if not user:
-                user = User(
-                    id=str(uuid.uuid4()),
-                    email=username
-                )
-                self.db_session.add(user)
-                self.db_session.commit()
-                self.db_session.refresh(user)
+            # Tokens that carry the user id: primary-key lookup via the identity map.
+            # Any other subject is an email or username and never matches an id
+            user = db_session.get(User, subject) if _is_user_id(subject) else None
+            if user is None:
+                # Email (or username-style) subject: Benutzer in lokaler DB finden
+                user = db_session.execute(USER_BY_EMAIL, {"email": subject}).scalar_one_or_none()
+                
+                # Wenn Benutzer nicht existiert, neuen anlegen
+                if not user:
+                    user = User(
+                        id=str(uuid.uuid4()),
+                        email=subject
+                    )
+                    db_session.add(user)
+                    db_session.commit()
+                    db_session.refresh(user)
             
+            _token_cache[cache_key] = (user.id, payload["exp"])
             return user
             
         except jwt.ExpiredSignatureError:
@@ -48,29 +139,31 @@ class JWTAuthService(AuthServiceInterface):
             # Andere Fehler
             return None
     
-    async def get_current_user(self, token: str) -> Optional[User]:
-        return await self.authenticate(token)
+    async def get_current_user(self, token: str, db_session: Session) -> Optional[User]:
+        return await self.authenticate(token, db_session)
 
 
 class MockAuthService(AuthServiceInterface):
-    def __init__(self, db_session: Session):
-        self.db_session = db_session
-    
-    async def authenticate(self, token: str) -> Optional[User]:
+    async def authenticate(self, token: str, db_session: Session) -> Optional[User]:
         # Mock authentication for testing
-        if token.startswith("mock-token-for-"):
-            user_id = token.replace("mock-token-for-", "")
-            user = self.db_session.query(User).filter(User.id == user_id).first()
+        if token.startswith(_MOCK_PREFIX):
+            user_id = token[len(_MOCK_PREFIX):]
+            user = db_session.get(User, user_id)
             return user
         return None
     
-    async def get_current_user(self, token: str) -> Optional[User]:
-        return await self.authenticate(token)
+    async def get_current_user(self, token: str, db_session: Session) -> Optional[User]:
+        return await self.authenticate(token, db_session)
+
+
+# Both services are stateless, so one instance of each serves every request
+_jwt_auth_service = JWTAuthService()
+_mock_auth_service = MockAuthService()
 
 
-def get_auth_service(db_session: Session) -> AuthServiceInterface:
+def get_auth_service() -> AuthServiceInterface:
     """Factory function to get the appropriate auth service based on environment"""
     if os.getenv("TESTING", "false").lower() == "true":
-        return MockAuthService(db_session)
+        return _mock_auth_service
     else:
-        return JWTAuthService(db_session)
\ No newline at end of file
+        return _jwt_auth_service
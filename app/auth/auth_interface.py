@@ -1,13 +1,14 @@
 from abc import ABC, abstractmethod
 from typing import Optional
+from sqlalchemy.orm import Session
 from ..models import User
 
 
 class AuthServiceInterface(ABC):
     @abstractmethod
-    async def authenticate(self, token: str) -> Optional[User]:
+    async def authenticate(self, token: str, db_session: Session) -> Optional[User]:
         pass
     
     @abstractmethod
-    async def get_current_user(self, token: str) -> Optional[User]:
-        pass
\ No newline at end of file
+    async def get_current_user(self, token: str, db_session: Session) -> Optional[User]:
+        pass
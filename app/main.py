@@ -1,37 +1,69 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from fastapi import FastAPI, Depends, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from pydantic import TypeAdapter
 from typing import List
 import os
+import orjson
 
-from .services import ForecastingService
+from .services import ForecastingService, USE_NUMBA
 from .database import get_db, Base, engine
-from .models import User, PVSystem, PVSystemCreate, PVSystemRead, ForecastRequest, ForecastResponse
-from .auth.auth_implementations import get_auth_service, AuthServiceInterface
+from .models import User, PVSystem, PVSystemCreate, PVSystemRead, ForecastRequest
+from .queries import PV_SYSTEM_BY_ID_AND_OWNER, PV_SYSTEMS_BY_OWNER
+from .auth.auth_implementations import get_auth_service
 
-app = FastAPI()
-service = ForecastingService()
-security = HTTPBearer()
+# Set RUN_MIGRATIONS=false where the schema is managed externally so workers skip DDL
+RUN_MIGRATIONS = os.getenv("RUN_MIGRATIONS", "true").lower() == "true"
 
-# Create database tables
-try:
-    Base.metadata.create_all(bind=engine)
-except Exception as e:
-    print(f"Warning: Could not create database tables: {e}")
+class ForecastJSONResponse(ORJSONResponse):
+    """orjson response that writes UTC datetimes as 2024-01-01T00:00:00Z"""
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create database tables once per worker at startup, not at import time
+    if RUN_MIGRATIONS:
+        try:
+            Base.metadata.create_all(bind=engine)
+        except Exception as e:
+            print(f"Warning: Could not create database tables: {e}")
+    # Pay the numba JIT compile at startup rather than in the first forecast;
+    # without numba there is nothing to compile and pvlib stays unloaded
+    if USE_NUMBA:
+        get_service().warm_up()
+    yield
+    # Close pooled DB connections and the weather fetch threads when the
+    # worker shuts down; a service that was never built has nothing to stop
+    if get_service.cache_info().currsize:
+        get_service().close()
+    engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+# Validates ORM rows and encodes them to JSON in one pydantic-core pass
+_systems_adapter = TypeAdapter(List[PVSystemRead])
+# Missing credentials are reported by get_current_user, not by the scheme
+_bearer = HTTPBearer(auto_error=False)
 
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)),
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(_bearer),
     db: Session = Depends(get_db)
 ):
-    if not credentials:
+    if credentials is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Not authenticated"
         )
     
     # Get appropriate auth service based on environment
-    auth_service = get_auth_service(db)
-    current_user = await auth_service.get_current_user(credentials.credentials)
+    auth_service = get_auth_service()
+    current_user = await auth_service.get_current_user(credentials.credentials, db)
     
     if not current_user:
         raise HTTPException(
@@ -39,8 +71,33 @@ async def get_current_user(
             detail="Could not validate credentials"
         )
     
+    # Strong reference for the rest of the request (the identity map is weak)
+    # plus a per-request cache for data derived from the user
+    request.state.user = current_user
+    request.state.cache = {}
     return current_user
 
+@lru_cache(maxsize=1)
+def get_service() -> ForecastingService:
+    """Forecasting service built on first use, so startup stays free of pandas/pvlib"""
+    return ForecastingService()
+
+def get_cached_user_systems(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+) -> List[PVSystem]:
+    """PV systems of the current user, queried at most once per request"""
+    cache = request.state.cache
+    if "pv_systems" not in cache:
+        systems = db.scalars(PV_SYSTEMS_BY_OWNER, {"user_id": current_user.id}).all()
+        # Every row belongs to the current user: populate the relationship
+        # directly so touching system.user never issues a SELECT per system
+        for system in systems:
+            set_committed_value(system, "user", current_user)
+        cache["pv_systems"] = systems
+    return cache["pv_systems"]
+
 @app.get("/forecast/hello")
 def read_root():
     return {"message": "Hello from Forecasting Tool Microservice"}
@@ -54,34 +111,33 @@ def health_check():
         "version": "1.0.0"
     }
 
-@app.post("/forecast/production/{system_id}")
+@app.post("/forecast/production/{system_id}", response_class=ForecastJSONResponse)
 def forecast_production(
     system_id: int,
     request: ForecastRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    service: ForecastingService = Depends(get_service)
 ):
     # Check if system belongs to user
-    pv_system = db.query(PVSystem).filter(
-        PVSystem.id == system_id,
-        PVSystem.user_id == current_user.id
-    ).first()
+    pv_system = db.execute(
+        PV_SYSTEM_BY_ID_AND_OWNER,
+        {"system_id": system_id, "user_id": current_user.id}
+    ).scalar_one_or_none()
     
     if not pv_system:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="PV System not found")
     
-    # Generate forecast
-    weather_data = service.get_weather_data(pv_system, days=7)
-    power_forecast = service.predict_production(pv_system, weather_data)
-    response = service.format_forecast_response(system_id, power_forecast)
-    
-    return response
+    # Generate forecast (cached per system and hour); the response holds only
+    # str/int/float/datetime, so orjson encodes it directly without jsonable_encoder
+    return ForecastJSONResponse(service.generate_forecast(pv_system, days=7))
 
 @app.post("/forecast/systems", response_model=PVSystemRead, status_code=status.HTTP_201_CREATED)
 def create_pv_system(
     system: PVSystemCreate, 
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    service: ForecastingService = Depends(get_service)
 ):
     db_system = PVSystem(
         user_id=current_user.id,
@@ -93,14 +149,38 @@ def create_pv_system(
         azimuth=system.azimuth
     )
     db.add(db_system)
+    # The INSERT fills in the id and the session keeps the loaded attributes
+    # after commit, so no refresh SELECT is needed
     db.commit()
-    db.refresh(db_system)
+    # SQLite may hand out the id of a deleted system again
+    service.invalidate_forecast(db_system.id)
     return db_system
 
+@app.post("/forecast/systems/batch", response_model=List[PVSystemRead], status_code=status.HTTP_201_CREATED)
+def create_pv_systems(
+    systems: List[PVSystemCreate],
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    service: ForecastingService = Depends(get_service)
+):
+    if not systems:
+        return []
+    
+    # One multi-row INSERT ... RETURNING for the whole batch
+    db_systems = db.scalars(
+        insert(PVSystem).returning(PVSystem, sort_by_parameter_order=True),
+        [{**system.model_dump(), "user_id": current_user.id} for system in systems]
+    ).all()
+    db.commit()
+    for db_system in db_systems:
+        service.invalidate_forecast(db_system.id)
+    return db_systems
+
 @app.get("/forecast/systems", response_model=List[PVSystemRead])
 def get_user_systems(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    systems: List[PVSystem] = Depends(get_cached_user_systems)
 ):
-    systems = db.query(PVSystem).filter(PVSystem.user_id == current_user.id).all()
-    return systems
+    # Returning a Response skips FastAPI's second validation + jsonable_encoder
+    # pass; response_model still documents the schema
+    payload = _systems_adapter.validate_python(systems, from_attributes=True)
+    return Response(_systems_adapter.dump_json(payload), media_type="application/json")
@@ -0,0 +1,16 @@
+from sqlalchemy import select, bindparam
+
+from .models import User, PVSystem
+
+# Hot-path statements are built once at import with bound parameters, so every
+# request reuses the same statement object and hits SQLAlchemy's compiled cache
+# instead of rebuilding and re-hashing the query construct per call.
+
+USER_BY_EMAIL = select(User).where(User.email == bindparam("email"))
+
+PV_SYSTEM_BY_ID_AND_OWNER = select(PVSystem).where(
+    PVSystem.id == bindparam("system_id"),
+    PVSystem.user_id == bindparam("user_id")
+)
+
+PV_SYSTEMS_BY_OWNER = select(PVSystem).where(PVSystem.user_id == bindparam("user_id"))
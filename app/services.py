@@ -1,56 +1,173 @@
-import pvlib
-import pandas as pd
+import time
+import math
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from cachetools import TTLCache
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Union
 
+from ._kernels import bulk_energy, poa_to_ac_kw
 from .models import PVSystem
-from .weather_client import OpenMeteoClient
+from .weather_client import OpenMeteoClient, WEATHER_DTYPE
+
+if TYPE_CHECKING:
+    # pandas/pvlib are imported lazily inside the methods that need them so
+    # workers that never serve a forecast don't load NumPy, pandas and pvlib
+    import numpy as np
+    import pandas as pd
+    import pvlib
 
 # Date/Time format constants (ISO 8601 compliant)
 DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"  # Full ISO 8601 timestamp
 DAY_FORMAT = "%Y-%m-%d"                # YYYY-MM-DD format
 
+# Numba-compiled SPA is several times faster than the NumPy one; pvlib would
+# reload its spa module on every call if asked for numba without it installed
+USE_NUMBA = importlib.util.find_spec("numba") is not None
+SOLAR_POSITION_METHOD = "nrel_numba" if USE_NUMBA else "nrel_numpy"
+
+# Solar position depends only on location and time, so systems within ~100 m
+# of each other share one computation per weather index
+SOLAR_POSITION_DECIMALS = 3
+
+
+@lru_cache(maxsize=512)
+def _solar_position(lat: float, lon: float, tz, times_ns: tuple) -> "pd.DataFrame":
+    """
+    Solar position for a quantized location and an hourly index given as
+    nanosecond epoch values (UTC for tz-aware indexes, wall time otherwise).
+    
+    The cached DataFrame is shared between callers and must not be modified.
+    """
+    import numpy as np
+    import pandas as pd
+    import pvlib
+    
+    times = pd.DatetimeIndex(np.array(times_ns, dtype="datetime64[ns]"))
+    if tz is not None:
+        times = times.tz_localize("UTC").tz_convert(tz)
+    return pvlib.solarposition.get_solarposition(times, lat, lon, method=SOLAR_POSITION_METHOD)
+
+
+@lru_cache(maxsize=256)
+def _build_pvlib_system(tilt: float, azimuth: float, kwp: float) -> "pvlib.pvsystem.PVSystem":
+    """
+    pvlib model of a PV system, built once per distinct configuration.
+    
+    The cached model is shared between callers and must not be modified.
+    """
+    import pvlib
+    
+    # Convert kWp to W for pvlib (peak DC power)
+    pdc0 = kwp * 1000  # 5.0 kWp = 5000 W DC
+    
+    # Standard PV module parameters (can be customized)
+    module_parameters = {
+        'pdc0': pdc0,                    # Peak DC power at STC (W)
+        'gamma_pdc': -0.004,              # Temperature coefficient (%/°C)
+    }
+    
+    # Standard temperature model parameters
+    temperature_model_parameters = {
+        'a': -3.56,      # a coefficient
+        'b': -0.075,     # b coefficient  
+        'deltaT': 3       # Temperature difference above ambient (°C)
+    }
+    
+    return pvlib.pvsystem.PVSystem(
+        surface_tilt=tilt,
+        surface_azimuth=azimuth,
+        module_parameters=module_parameters,
+        temperature_model_parameters=temperature_model_parameters
+    )
+
 
 class ForecastingService:
     """Service for calculating PV power production forecasts based on weather data."""
     
+    FORECAST_CACHE_SIZE = 2048
+    FORECAST_CACHE_TTL = 3600  # seconds; entries are also keyed by clock hour
+    WEATHER_FETCH_WORKERS = 8  # parallel OpenMeteo requests per batch
+    GAMMA_PDC = -0.003  # standard PVWatts temperature coefficient (1/°C)
+    INVERTER_EFFICIENCY = 0.95  # typical inverter efficiency
+    
     def __init__(self):
         self.weather_client = OpenMeteoClient()
+        self._forecast_cache = TTLCache(
+            maxsize=self.FORECAST_CACHE_SIZE, ttl=self.FORECAST_CACHE_TTL
+        )
+        self._forecast_cache_lock = threading.Lock()
+        # Threads are only started once a batch actually needs to fetch
+        self._weather_executor = ThreadPoolExecutor(
+            max_workers=self.WEATHER_FETCH_WORKERS, thread_name_prefix="weather"
+        )
     
-    def create_pv_system_model(self, pv_system: PVSystem) -> pvlib.pvsystem.PVSystem:
+    def warm_up(self) -> None:
+        """Trigger the one-off numba JIT compile of the SPA kernels ahead of the first forecast."""
+        import pandas as pd
+        import pvlib
+        
+        times = pd.date_range("2024-06-21 10:00", periods=2, freq="h", tz="UTC")
+        pvlib.solarposition.get_solarposition(times, 48.2, 16.4, method=SOLAR_POSITION_METHOD)
+    
+    def close(self) -> None:
+        """Stop the weather fetch threads; in-flight fetches are not waited for."""
+        self._weather_executor.shutdown(wait=False)
+    
+    def generate_forecast(self, pv_system: PVSystem, days: int = 7) -> Dict:
         """
-        Convert SQLAlchemy PVSystem to pvlib PVSystem model for calculations.
+        Build the full forecast response for a PV system, reusing the response
+        computed earlier in the same clock hour.
         
         Args:
-            pv_system: Database PV system configuration
+            pv_system: PV system configuration
+            days: Number of forecast days (1-7)
             
         Returns:
-            pvlib.pvsystem.PVSystem: Configured PV system model
+            Dict: Formatted forecast response (see format_forecast_response).
+                The dict is shared with later callers through the cache and
+                must not be mutated.
         """
-        # Convert kWp to W for pvlib (peak DC power)
-        pdc0 = pv_system.kwp * 1000  # 5.0 kWp = 5000 W DC
+        key = (pv_system.id, days, int(time.time() // 3600))
+        with self._forecast_cache_lock:
+            response = self._forecast_cache.get(key)
+        if response is not None:
+            return response
         
-        # Standard PV module parameters (can be customized)
-        module_parameters = {
-            'pdc0': pdc0,                    # Peak DC power at STC (W)
-            'gamma_pdc': -0.004,              # Temperature coefficient (%/°C)
-        }
+        weather_data = self.get_weather_data(pv_system, days=days)
+        power_forecast = self.predict_production(pv_system, weather_data)
+        response = self.format_forecast_response(pv_system.id, power_forecast)
         
-        # Standard temperature model parameters
-        temperature_model_parameters = {
-            'a': -3.56,      # a coefficient
-            'b': -0.075,     # b coefficient  
-            'deltaT': 3       # Temperature difference above ambient (°C)
-        }
+        # Don't pin an empty forecast caused by an upstream weather outage
+        if response['forecast_hours']:
+            with self._forecast_cache_lock:
+                self._forecast_cache[key] = response
+        return response
+    
+    def invalidate_forecast(self, system_id: int) -> None:
+        """Drop cached forecasts of a PV system whose configuration changed."""
+        with self._forecast_cache_lock:
+            for key in [k for k in self._forecast_cache if k[0] == system_id]:
+                self._forecast_cache.pop(key, None)
+    
+    def create_pv_system_model(self, pv_system: PVSystem) -> "pvlib.pvsystem.PVSystem":
+        """
+        Convert SQLAlchemy PVSystem to pvlib PVSystem model for calculations.
         
-        return pvlib.pvsystem.PVSystem(
-            surface_tilt=pv_system.tilt,
-            surface_azimuth=pv_system.azimuth,
-            module_parameters=module_parameters,
-            temperature_model_parameters=temperature_model_parameters
-        )
+        Models are cached per (tilt, azimuth, kwp), so an edited system
+        simply maps to a different entry.
+        
+        Args:
+            pv_system: Database PV system configuration
+            
+        Returns:
+            pvlib.pvsystem.PVSystem: Configured PV system model (shared, read-only)
+        """
+        return _build_pvlib_system(pv_system.tilt, pv_system.azimuth, pv_system.kwp)
     
-    def get_weather_data(self, pv_system: PVSystem, days: int = 2) -> pd.DataFrame:
+    def get_weather_data(self, pv_system: PVSystem, days: int = 2) -> "pd.DataFrame":
         """
         Fetch weather forecast data for PV system location.
         
@@ -67,7 +184,62 @@ class ForecastingService:
             days=days
         )
     
-    def predict_production(self, pv_system: PVSystem, weather_df: pd.DataFrame) -> pd.Series:
+    def get_weather_data_batch(self, pv_systems: List[PVSystem], days: int = 2) -> Dict[int, "pd.DataFrame"]:
+        """
+        Fetch weather forecasts for several PV systems at once.
+        
+        Systems in the same weather grid cell share one request, cached
+        forecasts are used directly and the remaining requests run in parallel.
+        No endpoint calls this yet: /forecast/production handles a single
+        system through generate_forecast.
+        
+        Args:
+            pv_systems: PV systems with location data
+            days: Number of forecast days (1-7)
+            
+        Returns:
+            Dict[int, pd.DataFrame]: Weather data per PV system id
+        """
+        client = self.weather_client
+        systems_by_key = {}
+        for pv_system in pv_systems:
+            key = client.cache_key(pv_system.latitude, pv_system.longitude, days)
+            systems_by_key.setdefault(key, []).append(pv_system)
+        
+        weather_by_key = {}
+        missing = []
+        for key, systems in systems_by_key.items():
+            df = client.get_cached_forecast(systems[0].latitude, systems[0].longitude, days)
+            if df is None:
+                missing.append(key)
+            else:
+                weather_by_key[key] = df
+        
+        if len(missing) == 1:
+            first = systems_by_key[missing[0]][0]
+            weather_by_key[missing[0]] = client.get_forecast(first.latitude, first.longitude, days)
+        elif missing:
+            futures = {
+                key: self._weather_executor.submit(
+                    client.get_forecast,
+                    systems_by_key[key][0].latitude,
+                    systems_by_key[key][0].longitude,
+                    days
+                )
+                for key in missing
+            }
+            for key, future in futures.items():
+                weather_by_key[key] = future.result()
+        
+        # Every system gets its own frame, like get_weather_data
+        weather = {}
+        for key, systems in systems_by_key.items():
+            df = weather_by_key[key]
+            for i, pv_system in enumerate(systems):
+                weather[pv_system.id] = df if i == 0 else df.copy()
+        return weather
+    
+    def predict_production(self, pv_system: PVSystem, weather_df: "pd.DataFrame") -> "pd.Series":
         """
         Calculate AC power production from weather data using pvlib with proper system model.
         
@@ -78,73 +250,147 @@ class ForecastingService:
         Returns:
             pd.Series: Hourly AC power production in kilowatts
         """
+        import numpy as np
+        import pandas as pd
+        import pvlib
+        
         if weather_df.empty:
             return pd.Series(dtype=float)
         
+        # Hours without any irradiance (night) have zero POA whatever the sun's
+        # position, so solar position and transposition only run on the rest;
+        # missing values stay in the computed subset and propagate as before
+        ghi = weather_df['ghi'].to_numpy()
+        dni = weather_df['dni'].to_numpy()
+        dhi = weather_df['dhi'].to_numpy()
+        active = ~((ghi == 0) & (dni == 0) & (dhi == 0))
+        poa_global = np.zeros(len(weather_df), dtype=WEATHER_DTYPE)
         
-        # Prepare weather data for pvlib using proper system model
-        # Convert temperature to Celsius for pvlib (pvlib handles units internally)
-        weather_data = {
-            'ghi': weather_df['ghi'],
-            'dni': weather_df['dni'], 
-            'dhi': weather_df['dhi'],
-            'temp_air': weather_df['temp_air'],  # Keep in Celsius
-            'wind_speed': weather_df['wind_speed']
-        }
+        if active.any():
+            # Calculate plane-of-array irradiance using system orientation
+            times = pd.DatetimeIndex(weather_df.index)[active].as_unit("ns")
+            solar_position = _solar_position(
+                round(pv_system.latitude, SOLAR_POSITION_DECIMALS),
+                round(pv_system.longitude, SOLAR_POSITION_DECIMALS),
+                times.tz,
+                tuple(times.asi8)
+            )
+            
+            poa_irradiance = pvlib.irradiance.get_total_irradiance(
+                surface_tilt=pv_system.tilt,
+                surface_azimuth=pv_system.azimuth,
+                solar_zenith=solar_position['apparent_zenith'].to_numpy(),
+                solar_azimuth=solar_position['azimuth'].to_numpy(),
+                dni=dni[active],
+                ghi=ghi[active],
+                dhi=dhi[active]
+            )
+            poa_global[active] = poa_irradiance['poa_global']
         
-        # Calculate plane-of-array irradiance using system orientation
-        solar_position = pvlib.solarposition.get_solarposition(
-            weather_df.index,
-            pv_system.latitude,
-            pv_system.longitude
+        # DC power from database system parameters (PVWatts, standard -0.3 %/°C
+        # temperature coefficient) with typical inverter efficiency (95%), in kW;
+        # the kernel writes into a WEATHER_DTYPE array like the weather input
+        ac_power_kw = poa_to_ac_kw(
+            poa_global,
+            weather_df['temp_air'].to_numpy(dtype=WEATHER_DTYPE),
+            pv_system.kwp * 1000,  # Use database kwp directly
+            self.GAMMA_PDC,
+            self.INVERTER_EFFICIENCY
         )
+        return pd.Series(ac_power_kw, index=weather_df.index)
+    
+    def predict_production_batch(self, pv_systems: List[PVSystem],
+                                 weather_by_system: Dict[int, "pd.DataFrame"]) -> Dict[int, "pd.Series"]:
+        """
+        Calculate AC power production for several PV systems at once.
         
-        poa_irradiance = pvlib.irradiance.get_total_irradiance(
-            surface_tilt=pv_system.tilt,
-            surface_azimuth=pv_system.azimuth,
-            solar_zenith=solar_position['apparent_zenith'],
-            solar_azimuth=solar_position['azimuth'],
-            dni=weather_df['dni'],
-            ghi=weather_df['ghi'],
-            dhi=weather_df['dhi']
-        )
+        Systems that share a solar position (same ~100 m cell and weather
+        index) are computed together: one solar position lookup, one
+        get_total_irradiance call on (systems x hours) arrays and one kernel
+        pass. Results match predict_production per system. Like
+        get_weather_data_batch, this is not called by any endpoint yet.
         
-        # Calculate DC power using database system parameters
-        dc_power = pvlib.pvsystem.pvwatts_dc(
-            g_poa_effective=poa_irradiance['poa_global'],
-            temp_cell=weather_data['temp_air'] + 3,
-            pdc0=pv_system.kwp * 1000,  # Use database kwp directly
-            gamma_pdc=-0.003  # Use standard temperature coefficient
-        )
+        Args:
+            pv_systems: PV system configurations
+            weather_by_system: Weather data per PV system id (see get_weather_data_batch)
+            
+        Returns:
+            Dict[int, pd.Series]: Hourly AC power production in kilowatts per PV system id
+        """
+        import numpy as np
+        import pandas as pd
+        import pvlib
         
-        # Convert to AC power with typical inverter efficiency (95%)
-        inverter_efficiency = 0.95
-        ac_power = dc_power * inverter_efficiency
+        power = {}
+        groups = {}
+        for pv_system in pv_systems:
+            weather_df = weather_by_system[pv_system.id]
+            if weather_df.empty:
+                power[pv_system.id] = pd.Series(dtype=float)
+                continue
+            times = pd.DatetimeIndex(weather_df.index).as_unit("ns")
+            key = (
+                round(pv_system.latitude, SOLAR_POSITION_DECIMALS),
+                round(pv_system.longitude, SOLAR_POSITION_DECIMALS),
+                times.tz,
+                tuple(times.asi8)
+            )
+            groups.setdefault(key, []).append(pv_system)
         
-        # Convert to kilowatts and return as Series
-        ac_power_kw = pd.Series(ac_power / 1000, index=weather_df.index)
-        return ac_power_kw
+        for key, systems in groups.items():
+            solar_position = _solar_position(*key)
+            frames = [weather_by_system[pv_system.id] for pv_system in systems]
+            
+            def stack(column):
+                return np.stack([frame[column].to_numpy(dtype=WEATHER_DTYPE) for frame in frames])
+            
+            # Orientation per row, solar position per column
+            poa_global = pvlib.irradiance.get_total_irradiance(
+                surface_tilt=np.array([pv_system.tilt for pv_system in systems])[:, None],
+                surface_azimuth=np.array([pv_system.azimuth for pv_system in systems])[:, None],
+                solar_zenith=solar_position['apparent_zenith'].to_numpy()[None, :],
+                solar_azimuth=solar_position['azimuth'].to_numpy()[None, :],
+                dni=stack('dni'),
+                ghi=stack('ghi'),
+                dhi=stack('dhi')
+            )['poa_global']
+            
+            ac_power_kw = poa_to_ac_kw(
+                poa_global.astype(WEATHER_DTYPE),
+                stack('temp_air'),
+                np.array([pv_system.kwp * 1000 for pv_system in systems])[:, None],
+                self.GAMMA_PDC,
+                self.INVERTER_EFFICIENCY
+            )
+            for pv_system, frame, row in zip(systems, frames, ac_power_kw):
+                power[pv_system.id] = pd.Series(row, index=frame.index)
+        
+        return {pv_system.id: power[pv_system.id] for pv_system in pv_systems}
     
-    def calculate_energy_kwh(self, power_series: pd.Series) -> float:
+    def calculate_energy_kwh(self, power_series: "Union[pd.Series, np.ndarray]") -> float:
         """
         Calculate total energy in kWh from power series.
         
         Args:
-            power_series: Hourly power values in kW
+            power_series: Hourly power values in kW (Series or NumPy array)
             
         Returns:
             float: Total energy in kWh
         """
-        # Energy = Power × Time (1 hour for each data point)
-        return power_series.sum()  # Series of kW summed = kWh
+        import numpy as np
+        
+        # Energy = Power × Time (1 hour for each data point); one C loop over
+        # the values, accumulated in double precision since forecasts are float32
+        return float(np.nansum(np.asarray(power_series, dtype=np.float64)))  # Series of kW summed = kWh
     
-    def format_forecast_response(self, system_id: int, power_series: pd.Series) -> Dict:
+    def format_forecast_response(self, system_id: int, power_series: "Union[pd.Series, np.ndarray]") -> Dict:
         """
         Format forecasting results into API response format with daily grouping.
         
         Args:
             system_id: PV system identifier
-            power_series: Hourly power production in kW
+            power_series: Hourly power production in kW (Series or NumPy array;
+                only the values are used, positioned from today 00:00 UTC)
             
         Returns:
             Dict: Formatted forecast response with daily structure
@@ -153,47 +399,50 @@ class ForecastingService:
         if len(power_series) > 168:
             raise ValueError(f"Maximum 168 hours allowed, got {len(power_series)}")
         
-        total_energy_kwh = self.calculate_energy_kwh(power_series)
+        import numpy as np
+        import pandas as pd
+        
+        # One NumPy pass for all numbers: pad to 7 x 24 so the total and the
+        # per-day sums come from one matrix, and round every hourly value at once
+        values = np.asarray(power_series, dtype=np.float64)
+        hours = len(values)
+        padded = np.zeros(168)
+        padded[:hours] = values
+        total_energy_kwh, daily_energy = bulk_energy(padded.reshape(7, 24))
+        hourly_kw = values.round(2).tolist()
         
         forecast_list = []
          # Always use 00:00 of current day as starting point
         forecast_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
         
+        # All hourly and daily labels (ISO 8601) in one vectorized strftime call each
+        timestamps = pd.date_range(forecast_start, periods=hours, freq="h").strftime(DATETIME_FORMAT).tolist()
+        day_labels = pd.date_range(forecast_start, periods=7, freq="D").strftime(DAY_FORMAT).tolist()
+        
         for day_index in range(7):
             day_start = day_index * 24
             day_end = (day_index + 1) * 24
             
-            # Extract hours for this day
-            day_hours = power_series.iloc[day_start:day_end]
-            
-            # Format date string (YYYY-MM-DD)
-            day_date = forecast_start + timedelta(days=day_index)
-            day_str = day_date.strftime(DAY_FORMAT)
-            
-            # Calculate daily energy
-            daily_energy = sum(float(power) for power in day_hours)
-            
-            # Create hourly forecasts for this day
-            daily_forecasts = []
-            for hour, power_kw in enumerate(day_hours):
-                # Create timestamp for this hour (ISO 8601)
-                timestamp = day_date.replace(hour=hour)
-                daily_forecasts.append({
-                    'timestamp': timestamp.strftime(DATETIME_FORMAT),
-                    'power_kw': round(float(power_kw), 2)
-                })
+            # Create hourly forecasts for this day from the precomputed slices;
+            # hours without weather data (NaN) are left out rather than sent as null
+            daily_forecasts = [
+                {'timestamp': timestamp, 'power_kw': power_kw}
+                for timestamp, power_kw in zip(timestamps[day_start:day_end], hourly_kw[day_start:day_end])
+                if not math.isnan(power_kw)
+            ]
             
             forecast_list.append({
-                'day': day_str,
-                'daily_energy_kwh': round(daily_energy, 2),
+                'day': day_labels[day_index],
+                'daily_energy_kwh': round(float(daily_energy[day_index]), 2),
                 'forecast': daily_forecasts
             })
         
         return {
             'system_id': system_id,
             'total_energy_kwh': round(total_energy_kwh, 2),
-            'forecast_from': forecast_start.strftime(DATETIME_FORMAT),
-            'forecast_to': (forecast_start + timedelta(days=7)).strftime(DATETIME_FORMAT),
-            'forecast_hours': len(power_series),  # sollte 168 sein
+            # Kept as datetimes; the endpoint renders them as ISO 8601 with 'Z'
+            'forecast_from': forecast_start,
+            'forecast_to': forecast_start + timedelta(days=7),
+            'forecast_hours': int(np.count_nonzero(~np.isnan(values))),  # sollte 168 sein
             'forecast_list': forecast_list
         }
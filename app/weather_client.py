@@ -1,6 +1,36 @@
+import logging
+import threading
 import requests
-import pandas as pd
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cachetools import TTLCache
+from functools import lru_cache
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# DataFrame column -> OpenMeteo hourly variable
+HOURLY_FIELDS = {
+    "temp_air": "temperature_2m",
+    "ghi": "shortwave_radiation",
+    "dni": "direct_normal_irradiance",
+    "dhi": "diffuse_radiation",
+    "wind_speed": "wind_speed_10m",
+}
+# OpenMeteo returns local ISO 8601 times without seconds, e.g. 2023-10-27T10:00
+TIME_FORMAT = "%Y-%m-%dT%H:%M"
+logger = logging.getLogger(__name__)
+
+# Values come with one decimal, so single precision loses nothing and halves
+# the memory of cached frames and of every array derived from them
+WEATHER_DTYPE = "float32"
+
+@lru_cache(maxsize=1)
+def _empty_forecast() -> "pd.DataFrame":
+    """Shared empty result for failed requests (built on first use; hand out copies only)."""
+    import pandas as pd
+    return pd.DataFrame(columns=list(HOURLY_FIELDS), dtype=WEATHER_DTYPE)
 
 class OpenMeteoClient:
     """
@@ -8,11 +38,40 @@ class OpenMeteoClient:
     Returns data in a pandas DataFrame compatible with pvlib.
     """
     BASE_URL = "https://api.open-meteo.com/v1/forecast"
+    CACHE_SIZE = 1024
+    CACHE_TTL = 600  # seconds; OpenMeteo refreshes its model runs hourly
+
+    def __init__(self):
+        self._cache = TTLCache(maxsize=self.CACHE_SIZE, ttl=self.CACHE_TTL)
+        self._cache_lock = threading.Lock()
+        # Keep-alive session: later calls reuse the pooled TLS connection
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+        ))
+        self._session.headers.update({"Accept-Encoding": "gzip"})
 
-    def get_forecast(self, lat: float, lon: float, days: int = 2) -> pd.DataFrame:
+    @staticmethod
+    def cache_key(lat: float, lon: float, days: int) -> tuple:
+        """Cache key of a request; locations in the same ~1 km grid cell share it."""
+        return (round(lat, 2), round(lon, 2), days)
+
+    def get_cached_forecast(self, lat: float, lon: float, days: int = 2) -> "Optional[pd.DataFrame]":
+        """Returns a copy of the cached forecast, or None without making a request."""
+        with self._cache_lock:
+            df = self._cache.get(self.cache_key(lat, lon, days))
+        return None if df is None else df.copy()
+
+    def get_forecast(self, lat: float, lon: float, days: int = 2) -> "pd.DataFrame":
         """
         Fetches hourly weather forecast for a given location.
 
+        Successful responses are cached for CACHE_TTL seconds per ~1 km grid
+        cell and forecast length, so repeat requests skip the HTTP round trip.
+        Callers get a copy and may modify it freely.
+
         Args:
             lat (float): Latitude of the location.
             lon (float): Longitude of the location.
@@ -21,18 +80,36 @@ class OpenMeteoClient:
         Returns:
             pd.DataFrame: A DataFrame with a DatetimeIndex and columns:
                           'temp_air', 'ghi', 'dni', 'dhi', 'wind_speed'.
-                          Returns an empty DataFrame on error.
+                          Returns an empty DataFrame of its own on error.
         """
+        key = self.cache_key(lat, lon, days)
+        with self._cache_lock:
+            df = self._cache.get(key)
+        if df is not None:
+            return df.copy()
+
+        df = self._fetch_forecast(lat, lon, days)
+        if not df.empty:
+            with self._cache_lock:
+                self._cache[key] = df
+            return df.copy()
+        return df
+
+    def _fetch_forecast(self, lat: float, lon: float, days: int) -> "pd.DataFrame":
+        """Requests the forecast from OpenMeteo; see get_forecast."""
+        import numpy as np
+        import pandas as pd
+        
         params = {
             "latitude": lat,
             "longitude": lon,
-            "hourly": "temperature_2m,shortwave_radiation,direct_normal_irradiance,diffuse_radiation,wind_speed_10m",
+            "hourly": ",".join(HOURLY_FIELDS.values()),
             "forecast_days": days,
             "timezone": "auto"
         }
 
         try:
-            response = requests.get(self.BASE_URL, params=params, timeout=10)
+            response = self._session.get(self.BASE_URL, params=params, timeout=10)
             response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
             data = response.json()
 
@@ -40,23 +117,24 @@ class OpenMeteoClient:
             
             # Check if we got any data
             if not hourly.get("time"):
-                print("Warning: No time data received from OpenMeteo API.")
-                return pd.DataFrame()
+                logger.warning("No time data received from OpenMeteo API.")
+                return _empty_forecast().copy()
 
-            df = pd.DataFrame({
-                "temp_air": hourly.get("temperature_2m"),
-                "ghi": hourly.get("shortwave_radiation"),
-                "dni": hourly.get("direct_normal_irradiance"),
-                "dhi": hourly.get("diffuse_radiation"),
-                "wind_speed": hourly.get("wind_speed_10m")
-            })
+            # Fill one (columns x hours) WEATHER_DTYPE array straight from the
+            # JSON lists (nulls become NaN); pandas adopts it as a single block,
+            # so copies of cached frames are one memcpy
+            hours = len(hourly["time"])
+            values = np.empty((len(HOURLY_FIELDS), hours), dtype=WEATHER_DTYPE)
+            for row, field in zip(values, HOURLY_FIELDS.values()):
+                field_values = hourly.get(field)
+                row[:] = np.nan if field_values is None else np.asarray(field_values, dtype=WEATHER_DTYPE)
 
-            df.index = pd.to_datetime(hourly.get("time"))
-            return df
+            index = pd.DatetimeIndex(pd.to_datetime(hourly["time"], format=TIME_FORMAT, cache=True))
+            return pd.DataFrame(values.T, index=index, columns=list(HOURLY_FIELDS), copy=False)
 
         except requests.RequestException as e:
-            print(f"Error fetching weather data from OpenMeteo: {e}")
-            return pd.DataFrame()
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-            return pd.DataFrame()
+            logger.warning("Error fetching weather data from OpenMeteo: %s", e)
+            return _empty_forecast().copy()
+        except Exception:
+            logger.warning("An unexpected error occurred while parsing OpenMeteo data", exc_info=True)
+            return _empty_forecast().copy()
@@ -1,7 +1,12 @@
 import pytest
+import pytest_asyncio
 import os
-from sqlalchemy import create_engine
+import re
+from types import SimpleNamespace
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from fastapi.testclient import TestClient
 from fastapi import HTTPException, status
 
@@ -12,31 +17,95 @@ from app.models import User, PVSystem
 # Set TESTING environment variable
 os.environ["TESTING"] = "true"
 
-# Use an in-memory SQLite database for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+# Use an in-memory SQLite database for testing; StaticPool hands every
+# checkout the same connection, so all sessions see one database. Under
+# pytest-xdist every worker is its own process with its own database
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Same session behaviour as app.database.SessionLocal
+TestingSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+# Statements db_session emits to nest commits inside the test transaction
+HARNESS_SAVEPOINT = re.compile(r"(RELEASE |ROLLBACK TO )?SAVEPOINT ")
+
+
+# pysqlite's implicit transaction handling breaks SAVEPOINTs; let SQLAlchemy
+# emit BEGIN itself so session commits can nest inside the test transaction
+@event.listens_for(engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+    # Throwaway database: skip fsync bookkeeping and keep temp tables in RAM
+    # (an in-memory database already keeps its journal in memory)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA locking_mode=EXCLUSIVE")
+    cursor.close()
+
+
+@event.listens_for(engine, "begin")
+def _emit_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def create_schema():
+    """
+    Creates the schema once for the whole test run.
+    """
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
 
 
 @pytest.fixture(scope="function")
 def db_session():
     """
-    Creates a fresh database for each test function.
+    Runs each test function in a transaction that is rolled back afterwards.
+    Commits inside the test only release a SAVEPOINT, so nothing leaks
+    into the next test.
     """
-    Base.metadata.create_all(bind=engine)
-    session = TestingSessionLocal()
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
     try:
         yield session
     finally:
         session.close()
-        Base.metadata.drop_all(bind=engine)
+        transaction.rollback()
+        connection.close()
+
+
+@pytest.fixture(scope="session")
+def app_client():
+    """
+    One TestClient for the whole run; the app lifespan starts and stops once.
+    """
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def async_app_client():
+    """
+    One in-process httpx client on the session event loop. Requests go
+    straight to the ASGI app instead of through TestClient's thread portal.
+    """
+    async with app.router.lifespan_context(app):
+        transport = ASGITransport(app=app)
+        async with AsyncClient(transport=transport, base_url="http://testserver") as async_client:
+            yield async_client
 
 
 @pytest.fixture(scope="function")
-def client(db_session):
+def client(app_client, db_session):
     """
     Creates a test client with a dependency override to use the test database.
     Uses mock authentication by default for backward compatibility.
@@ -52,14 +121,52 @@ def client(db_session):
     
     app.dependency_overrides[get_db] = override_get_db
     
-    with TestClient(app) as test_client:
-        yield test_client
+    yield app_client
     app.dependency_overrides.clear()
     
     # Reset to real JWT auth for integration tests
     os.environ["TESTING"] = "false"
 
 
+@pytest.fixture(scope="function")
+def aclient(async_app_client, db_session):
+    """
+    Async counterpart of client: the shared httpx client with the test
+    database and mock authentication.
+    """
+    def override_get_db():
+        try:
+            yield db_session
+        finally:
+            db_session.close()
+    
+    os.environ["TESTING"] = "true"
+    app.dependency_overrides[get_db] = override_get_db
+    
+    yield async_app_client
+    app.dependency_overrides.clear()
+    
+    os.environ["TESTING"] = "false"
+
+
+@pytest.fixture
+def sql_counter():
+    """
+    Counts the SQL statements executed on the test engine; reset count to
+    start measuring after the test has seeded its data. The SAVEPOINTs that
+    db_session nests commits in are not counted: the app never issues them.
+    """
+    counter = SimpleNamespace(count=0)
+    
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if not HARNESS_SAVEPOINT.match(statement):
+            counter.count += 1
+    
+    event.listen(engine, "after_cursor_execute", _count)
+    yield counter
+    event.remove(engine, "after_cursor_execute", _count)
+
+
 @pytest.fixture
 def test_user(db_session):
     """
@@ -86,7 +193,7 @@ def auth_headers(test_user):
 
 
 @pytest.fixture
-def client_with_mock_auth(db_session):
+def client_with_mock_auth(app_client, db_session):
     """
     Creates a test client with mock authentication for legacy tests.
     """
@@ -101,8 +208,7 @@ def client_with_mock_auth(db_session):
     
     app.dependency_overrides[get_db] = override_get_db
     
-    with TestClient(app) as test_client:
-        yield test_client
+    yield app_client
     app.dependency_overrides.clear()
     
     # Reset TESTING environment
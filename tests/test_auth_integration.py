@@ -3,9 +3,9 @@ import asyncio
 import os
 import jwt
 from datetime import datetime, timedelta, timezone
-from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.database import get_db, Base
@@ -17,26 +17,61 @@ os.environ["TESTING"] = "false"  # Use real JWT auth for integration tests
 os.environ["JWT_SECRET"] = "test-secret-key"
 os.environ["ALGORITHM"] = "HS256"
 
-# Use in-memory SQLite for testing
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test_integration.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Use in-memory SQLite for testing, one shared connection via StaticPool
+SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+# Same session behaviour as app.database.SessionLocal
+TestingSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine
+)
+
+
+# Let SQLAlchemy emit BEGIN so commits nest as SAVEPOINTs (see conftest.py)
+@event.listens_for(engine, "connect")
+def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+    dbapi_connection.isolation_level = None
+    # Throwaway database: skip fsync bookkeeping and keep temp tables in RAM
+    # (an in-memory database already keeps its journal in memory)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA locking_mode=EXCLUSIVE")
+    cursor.close()
+
+
+@event.listens_for(engine, "begin")
+def _emit_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def create_integration_schema():
+    """Create the schema when the module's tests run, not when it is collected"""
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
 
 
 @pytest.fixture(scope="function")
 def db_session():
-    """Create a fresh database for each test"""
-    Base.metadata.create_all(bind=engine)
-    session = TestingSessionLocal()
+    """Run each test in a transaction that is rolled back afterwards"""
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = TestingSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
     try:
         yield session
     finally:
         session.close()
-        Base.metadata.drop_all(bind=engine)
+        transaction.rollback()
+        connection.close()
 
 
 @pytest.fixture(scope="function")
-def client(db_session):
+def client(app_client, db_session):
     """Create test client with database override"""
     def override_get_db():
         try:
@@ -46,8 +81,7 @@ def client(db_session):
     
     app.dependency_overrides[get_db] = override_get_db
     
-    with TestClient(app) as test_client:
-        yield test_client
+    yield app_client
     app.dependency_overrides.clear()
 
 
@@ -236,12 +270,10 @@ class TestAuthenticationIntegration:
 class TestUserAutoCreation:
     """Test user auto-creation functionality"""
     
-    def test_user_auto_created_on_first_request(self, client, valid_jwt_token):
+    def test_user_auto_created_on_first_request(self, client, db_session, valid_jwt_token):
         """Test that user is automatically created on first authenticated request"""
         # Verify user doesn't exist initially
-        db = TestingSessionLocal()
-        user = db.query(User).filter(User.email == "test@example.com").first()
-        db.close()
+        user = db_session.query(User).filter(User.email == "test@example.com").first()
         assert user is None
         
         # Make authenticated request
@@ -250,8 +282,6 @@ class TestUserAutoCreation:
         assert response.status_code == 200
         
         # Verify user was created
-        db = TestingSessionLocal()
-        user = db.query(User).filter(User.email == "test@example.com").first()
-        db.close()
+        user = db_session.query(User).filter(User.email == "test@example.com").first()
         assert user is not None
         assert user.email == "test@example.com"
@@ -1,10 +1,13 @@
 import pytest
-import pandas as pd
 from datetime import datetime, timezone, timedelta
 from pydantic import ValidationError
 
 from app.models import ForecastRequest, HourlyForecast, DayForecast, ForecastResponse
 
+# Shared forecast window; the models only check the values' types
+NOW = datetime.now(timezone.utc)
+NOW_PLUS_7 = NOW + timedelta(days=7)
+
 
 class TestForecastingModels:
     """Test suite for Pydantic models related to forecasting."""
@@ -23,23 +26,22 @@ class TestForecastingModels:
         request = ForecastRequest()
         assert request.days == 7
 
-    def test_forecast_request_invalid_days_below_minimum(self):
-        """Test that ForecastRequest rejects days < 1."""
-        with pytest.raises(ValidationError) as exc_info:
-            ForecastRequest(days=0)
-
-        assert "input should be greater than or equal to 1" in str(exc_info.value).lower()
-
-    def test_forecast_request_invalid_days_above_maximum(self):
-        """Test that ForecastRequest rejects days > 7."""
+    @pytest.mark.parametrize("days,error_type,ctx", [
+        (0, "greater_than_equal", {"ge": 1}),
+        (8, "less_than_equal", {"le": 7}),
+    ], ids=["below_minimum", "above_maximum"])
+    def test_forecast_request_invalid_days(self, days, error_type, ctx):
+        """Test that ForecastRequest rejects days outside 1..7."""
         with pytest.raises(ValidationError) as exc_info:
-            ForecastRequest(days=8)
+            ForecastRequest(days=days)
 
-        assert "input should be less than or equal to 7" in str(exc_info.value).lower()
+        # Structured errors avoid formatting the full error message
+        error = exc_info.value.errors()[0]
+        assert error["type"] == error_type
+        assert error["ctx"] == ctx
 
     def test_forecast_response_valid_data(self):
         """Test that ForecastResponse accepts valid data with daily structure."""
-        now = datetime.now(timezone.utc)
         hourly_forecasts = [
             HourlyForecast(
                 timestamp="2024-01-15T10:00:00Z",
@@ -62,8 +64,8 @@ class TestForecastingModels:
         response = ForecastResponse(
             system_id=123,
             total_energy_kwh=9.7,
-            forecast_from=now,
-            forecast_to=now + timedelta(days=7),
+            forecast_from=NOW,
+            forecast_to=NOW_PLUS_7,
             forecast_hours=48,
             forecast_list=daily_forecasts
         )
@@ -77,12 +79,11 @@ class TestForecastingModels:
 
     def test_forecast_response_empty_forecast(self):
         """Test that ForecastResponse accepts empty forecast list."""
-        now = datetime.now(timezone.utc)
         response = ForecastResponse(
             system_id=123,
             total_energy_kwh=0.0,
-            forecast_from=now,
-            forecast_to=now + timedelta(days=7),
+            forecast_from=NOW,
+            forecast_to=NOW_PLUS_7,
             forecast_hours=0,
             forecast_list=[]
         )
@@ -91,21 +92,6 @@ class TestForecastingModels:
         assert response.total_energy_kwh == 0.0
         assert len(response.forecast_list) == 0
 
-    def test_forecast_response_negative_total_energy(self):
-        """Test that ForecastResponse rejects negative total energy."""
-        now = datetime.now(timezone.utc)
-        with pytest.raises(ValidationError) as exc_info:
-            ForecastResponse(
-                system_id=123,
-                total_energy_kwh=-1.0,
-                forecast_from=now,
-                forecast_to=now + timedelta(days=7),
-                forecast_hours=168,
-                forecast_list=[]
-            )
-
-        assert "input should be greater than or equal to 0" in str(exc_info.value).lower()
-
     def test_hourly_forecast_valid_timestamp(self):
         """Test that HourlyForecast accepts valid timestamp."""
         forecast = HourlyForecast(
@@ -116,15 +102,26 @@ class TestForecastingModels:
         assert forecast.timestamp == "2024-01-15T10:00:00Z"
         assert forecast.power_kw == 4.5
 
-    def test_hourly_forecast_negative_power(self):
-        """Test that HourlyForecast rejects negative power."""
+    @pytest.mark.parametrize("model,data", [
+        (ForecastResponse, {
+            "system_id": 123,
+            "total_energy_kwh": -1.0,
+            "forecast_from": NOW,
+            "forecast_to": NOW_PLUS_7,
+            "forecast_hours": 168,
+            "forecast_list": []
+        }),
+        (HourlyForecast, {"timestamp": "2024-01-15T10:00:00Z", "power_kw": -1.0}),
+        (DayForecast, {"day": "2024-01-15", "daily_energy_kwh": -1.0, "forecast": []}),
+    ], ids=["total_energy", "hourly_power", "daily_energy"])
+    def test_negative_energy_rejected(self, model, data):
+        """Test that forecast models reject negative power and energy values."""
         with pytest.raises(ValidationError) as exc_info:
-            HourlyForecast(
-                timestamp="2024-01-15T10:00:00Z",
-                power_kw=-1.0
-            )
+            model(**data)
 
-        assert "input should be greater than or equal to 0" in str(exc_info.value).lower()
+        error = exc_info.value.errors()[0]
+        assert error["type"] == "greater_than_equal"
+        assert error["ctx"] == {"ge": 0}
 
     def test_day_forecast_structure(self):
         """Test that DayForecast accepts valid hourly forecast list."""
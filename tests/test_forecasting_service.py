@@ -1,74 +1,157 @@
-from app.services import ForecastingService
-from app.models import PVSystem
+from app.services import ForecastingService, _solar_position
+from app.weather_client import OpenMeteoClient
+from app._kernels import bulk_energy, poa_to_ac_kw
+from app.models import PVSystem, ForecastResponse
+import numpy as np
 import pandas as pd
-from datetime import datetime, timezone
+from datetime import timedelta, timezone
+from types import SimpleNamespace
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import MagicMock, patch
+
+# DatetimeIndex objects are immutable, so tests share them instead of re-parsing
+TWO_HOUR_INDEX = pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 11:00:00'], format='%Y-%m-%d %H:%M:%S')
+WEEK_INDEX = pd.date_range('2024-01-01', periods=168, freq='h')
+
+# Sample weather frames shared by the tests; the service only reads them
+# (batch fetches hand out copies), so tests must not modify them either
+WEATHER_ONE_HOUR = pd.DataFrame({
+    'temp_air': [15.0],
+    'ghi': [400.0],
+    'dni': [350.0],
+    'dhi': [50.0],
+    'wind_speed': [3.0]
+}, index=pd.to_datetime(['2024-06-01 10:00:00'], format='%Y-%m-%d %H:%M:%S'))
+WEATHER_TWO_HOURS = pd.DataFrame({
+    'temp_air': [20.0, 21.0],
+    'ghi': [400.0, 450.0],
+    'dni': [350.0, 400.0],
+    'dhi': [50.0, 60.0],
+    'wind_speed': [3.0, 3.5]
+}, index=TWO_HOUR_INDEX)
+WEATHER_THREE_HOURS = pd.DataFrame({
+    'temp_air': [15.0, 16.0, 14.0],
+    'ghi': [400.0, 450.0, 300.0],
+    'dni': [350.0, 400.0, 250.0],
+    'dhi': [50.0, 50.0, 50.0],
+    'wind_speed': [3.0, 3.5, 2.5]
+}, index=pd.date_range('2024-01-01 10:00', periods=3, freq='h'))
+# A full seven-day forecast, as get_forecast(days=7) returns it
+WEATHER_WEEK = pd.DataFrame({
+    'temp_air': np.full(len(WEEK_INDEX), 15.0),
+    'ghi': np.full(len(WEEK_INDEX), 400.0),
+    'dni': np.full(len(WEEK_INDEX), 350.0),
+    'dhi': np.full(len(WEEK_INDEX), 50.0),
+    'wind_speed': np.full(len(WEEK_INDEX), 3.0)
+}, index=WEEK_INDEX)
+
+@pytest.fixture(scope="session")
+def week_power_series():
+    """168 hours of 1.0 kW; shared, so tests must not modify it."""
+    return pd.Series(1.0, index=WEEK_INDEX)
+
+
+@pytest.fixture(scope="session")
+def three_hour_power_series():
+    """Three hours of power without a time index; shared, so tests must not modify it."""
+    return pd.Series([1.0, 2.0, 3.0])
+
+
+@pytest.fixture(scope="module")
+def shared_weather_client():
+    """One spec'd weather client mock for the whole module."""
+    return MagicMock(spec=OpenMeteoClient)
+
+
+@pytest.fixture
+def mock_weather_client(shared_weather_client):
+    """The shared weather client mock, reset for each test."""
+    shared_weather_client.reset_mock(return_value=True, side_effect=True)
+    return shared_weather_client
+
+
+@pytest.fixture(scope="class")
+def service():
+    """One ForecastingService per test class; its caches are cleared for each test."""
+    return ForecastingService()
+
+
+@pytest.fixture(scope="class")
+def sample_pv_system():
+    """Sample PV system for testing; shared, so tests must not modify it."""
+    # Create as instance, not constructor args
+    pv_system = PVSystem()
+    pv_system.id = 1
+    pv_system.user_id = "test-user"
+    pv_system.name = "Test PV System"
+    pv_system.latitude = 48.2082  # Vienna
+    pv_system.longitude = 16.3738
+    pv_system.kwp = 5.0  # 5 kW peak
+    pv_system.tilt = 35.0  # Typical roof tilt
+    pv_system.azimuth = 180.0  # South-facing
+    return pv_system
+
 
 class TestForecastingService:
     """Test suite for ForecastingService class."""
 
-    def setup_method(self):
-        """Set up test fixtures."""
-        self.service = ForecastingService()
-        
-        # Sample PV system for testing - create as instance, not constructor args
-        self.sample_pv_system = PVSystem()
-        self.sample_pv_system.id = 1
-        self.sample_pv_system.user_id = "test-user"
-        self.sample_pv_system.name = "Test PV System"
-        self.sample_pv_system.latitude = 48.2082  # Vienna
-        self.sample_pv_system.longitude = 16.3738
-        self.sample_pv_system.kwp = 5.0  # 5 kW peak
-        self.sample_pv_system.tilt = 35.0  # Typical roof tilt
-        self.sample_pv_system.azimuth = 180.0  # South-facing
+    @pytest.fixture(autouse=True)
+    def setup_service(self, service, sample_pv_system):
+        """Bind the shared fixtures and start each test with empty caches."""
+        service._forecast_cache.clear()
+        service.weather_client._cache.clear()
+        self.service = service
+        self.sample_pv_system = sample_pv_system
 
     def test_create_pv_system_model(self):
         """Test creation of pvlib PV system model from database model."""
         pv_system_model = self.service.create_pv_system_model(self.sample_pv_system)
         assert pv_system_model is not None
 
-    @patch('app.weather_client.OpenMeteoClient')
-    def test_get_weather_data_success(self, mock_weather_client_class):
+    def test_get_weather_data_success(self, monkeypatch, mock_weather_client):
         """Test successful weather data retrieval."""
-        mock_weather_data = pd.DataFrame({
-            'temp_air': [20.0, 21.0],
-            'ghi': [400.0, 450.0],
-            'dni': [350.0, 400.0],
-            'dhi': [50.0, 60.0],
-            'wind_speed': [3.0, 3.5]
-        }, index=pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 11:00:00']))
-        
         # Setup mock
-        mock_client_instance = mock_weather_client_class.return_value
-        mock_client_instance.get_forecast.return_value = mock_weather_data
+        mock_weather_client.get_forecast.return_value = WEATHER_WEEK
+        monkeypatch.setattr(self.service, "weather_client", mock_weather_client)
         
-        # Create service with mocked client
-        service = ForecastingService()
-        service.weather_client = mock_client_instance
-        
-        weather_data = service.get_weather_data(self.sample_pv_system, days=7)
+        weather_data = self.service.get_weather_data(self.sample_pv_system, days=7)
         
         assert not weather_data.empty
-        assert len(weather_data) == 2
+        assert len(weather_data) == 7 * 24
         assert 'temp_air' in weather_data.columns
-        mock_client_instance.get_forecast.assert_called_once()
+        mock_weather_client.get_forecast.assert_called_once_with(
+            lat=self.sample_pv_system.latitude,
+            lon=self.sample_pv_system.longitude,
+            days=7
+        )
 
-    @patch('app.weather_client.OpenMeteoClient')
-    def test_get_weather_data_empty(self, mock_weather_client_class):
+    def test_get_weather_data_empty(self, monkeypatch):
         """Test handling when no weather data is available."""
-        # Setup mock
-        mock_client_instance = mock_weather_client_class.return_value
-        mock_client_instance.get_forecast.return_value = pd.DataFrame()
-        
-        # Create service with mocked client
-        service = ForecastingService()
-        service.weather_client = mock_client_instance
+        # No call assertions needed, so a plain stub instead of a mock
+        stub_weather_client = SimpleNamespace(get_forecast=lambda *_a, **_k: pd.DataFrame())
+        monkeypatch.setattr(self.service, "weather_client", stub_weather_client)
         
-        weather_data = service.get_weather_data(self.sample_pv_system, days=7)
+        weather_data = self.service.get_weather_data(self.sample_pv_system, days=7)
         
         assert weather_data.empty
 
+    def test_get_weather_data_batch(self):
+        """Test that a batch fetches each weather grid cell once and reuses cached cells."""
+        weather = WEATHER_ONE_HOUR
+        neighbour = PVSystem(id=2, latitude=48.2084, longitude=16.3741)
+        linz = PVSystem(id=3, latitude=48.3069, longitude=14.2858)
+        graz = PVSystem(id=4, latitude=47.0707, longitude=15.4395)
+        
+        with patch.object(self.service.weather_client, '_fetch_forecast', return_value=weather) as fetch:
+            self.service.weather_client.get_forecast(graz.latitude, graz.longitude, days=2)
+            result = self.service.get_weather_data_batch([self.sample_pv_system, neighbour, linz, graz])
+        
+        # Vienna and its neighbour share a request, Graz was already cached
+        assert fetch.call_count == 3
+        assert set(result) == {1, 2, 3, 4}
+        assert result[1].equals(weather)
+        assert result[1] is not result[2]
+
     def test_predict_production_success(self):
         """Test PV production prediction with valid data."""
         mock_weather_data = pd.DataFrame({
@@ -84,6 +167,92 @@ class TestForecastingService:
         assert isinstance(power_series, pd.Series)
         assert len(power_series) == 2
 
+    def test_predict_production_shares_solar_position(self):
+        """Test that nearby systems reuse the cached solar position."""
+        index = pd.date_range("2024-06-21 10:00", periods=2, freq="h", tz="UTC")
+        mock_weather_data = pd.DataFrame({
+            'ghi': [400.0, 450.0],
+            'dni': [350.0, 400.0],
+            'dhi': [50.0, 60.0],
+            'temp_air': [20.0, 21.0],
+            'wind_speed': [3.0, 3.5]
+        }, index=index)
+        neighbour = PVSystem(id=2, latitude=48.20821, longitude=16.37379, kwp=3.0, tilt=20.0, azimuth=90.0)
+        
+        _solar_position.cache_clear()
+        first = self.service.predict_production(self.sample_pv_system, mock_weather_data)
+        second = self.service.predict_production(neighbour, mock_weather_data)
+        
+        assert _solar_position.cache_info().hits == 1
+        assert first.index.equals(index)
+        assert not second.equals(first)
+
+    def test_predict_production_batch_matches_single(self):
+        """Test that batched prediction matches predict_production for every system."""
+        
+        index = pd.date_range("2024-06-21", periods=48, freq="h", tz="UTC")
+        rng = np.random.default_rng(0)
+        weather = pd.DataFrame({
+            'ghi': rng.uniform(0, 900, 48),
+            'dni': rng.uniform(0, 800, 48),
+            'dhi': rng.uniform(0, 200, 48),
+            'temp_air': rng.uniform(5, 35, 48),
+            'wind_speed': rng.uniform(0, 5, 48)
+        }, index=index).astype("float32")
+        # Night hours: predict_production skips them, the batch computes them
+        weather.iloc[:6, :3] = 0.0
+        systems = [
+            self.sample_pv_system,
+            PVSystem(id=2, latitude=48.2082, longitude=16.3738, kwp=3.0, tilt=20.0, azimuth=90.0),
+            PVSystem(id=3, latitude=47.0707, longitude=15.4395, kwp=8.0, tilt=45.0, azimuth=200.0),
+            PVSystem(id=4, latitude=47.0707, longitude=15.4395, kwp=8.0, tilt=45.0, azimuth=200.0),
+        ]
+        weather_by_system = {1: weather, 2: weather, 3: weather * 0.5, 4: pd.DataFrame()}
+        
+        batch = self.service.predict_production_batch(systems, weather_by_system)
+        
+        assert list(batch) == [1, 2, 3, 4]
+        for pv_system in systems:
+            single = self.service.predict_production(pv_system, weather_by_system[pv_system.id])
+            assert batch[pv_system.id].index.equals(single.index)
+            assert np.allclose(batch[pv_system.id], single, atol=1e-4)
+
+    def test_poa_to_ac_kw_matches_pvwatts(self):
+        """Test that the fused power kernel matches pvlib's PVWatts DC model."""
+        import pvlib
+        
+        poa = np.array([0.0, 250.0, 800.0, 1100.0])
+        temp_air = np.array([-5.0, 12.0, 25.0, 38.0])
+        expected = pvlib.pvsystem.pvwatts_dc(poa, temp_air + 3, 5000.0, -0.003) * 0.95 / 1000
+        
+        assert np.allclose(poa_to_ac_kw(poa, temp_air, 5000.0, -0.003, 0.95), expected)
+
+    def test_bulk_energy_skips_missing_hours(self):
+        """Test that missing hours are left out of the total and of their day."""
+        
+        power = np.ones((7, 24))
+        power[1, 5] = np.nan
+        total, per_day = bulk_energy(power)
+        
+        assert total == 167.0
+        assert per_day[0] == 24.0
+        assert per_day[1] == 23.0
+
+    def test_format_forecast_response_skips_missing_hours(self, week_power_series):
+        """Test that hours without a power value are left out instead of reported as NaN."""
+        power = week_power_series.copy()
+        power.iat[30] = np.nan
+        
+        response = self.service.format_forecast_response(system_id=123, power_series=power)
+        
+        ForecastResponse.model_validate(response)
+        assert response['forecast_hours'] == 167
+        assert response['total_energy_kwh'] == 167.0
+        second_day = response['forecast_list'][1]
+        assert second_day['daily_energy_kwh'] == 23.0
+        assert len(second_day['forecast']) == 23
+        assert all(hour['timestamp'][11:13] != '06' for hour in second_day['forecast'])
+
     def test_predict_production_empty_weather(self):
         """Test PV production prediction with empty weather data."""
         mock_weather_data = pd.DataFrame()
@@ -107,87 +276,84 @@ class TestForecastingService:
         total_energy = self.service.calculate_energy_kwh(power_series)
         assert total_energy == 0.0
 
+    def test_energy_and_format_accept_arrays(self):
+        """Test that plain NumPy arrays work wherever a power series is accepted."""
+        
+        power = np.array([1.5, 2.0, 3.5], dtype=np.float32)
+        
+        assert self.service.calculate_energy_kwh(power) == 7.0
+        response = self.service.format_forecast_response(system_id=123, power_series=power)
+        assert response['total_energy_kwh'] == 7.0
+        assert response['forecast_list'][0]['forecast'][2]['power_kw'] == 3.5
+
     def test_format_forecast_response(self):
         """Test formatting of forecast response."""
         # Sample power series
-        timestamps = pd.to_datetime(['2024-01-01 10:00:00', '2024-01-01 11:00:00'])
-        power_series = pd.Series([1.5, 2.0], index=timestamps)
+        power_series = pd.Series([1.5, 2.0], index=TWO_HOUR_INDEX)
         
         response = self.service.format_forecast_response(system_id=123, power_series=power_series)
         
         assert response['system_id'] == 123
         assert response['total_energy_kwh'] == 3.5
         assert len(response['forecast_list']) == 7  # 7 Tage
-        assert 'forecast_from' in response
-        assert 'forecast_to' in response
-        assert 'forecast_list' in response
+        ForecastResponse.model_validate(response)
 
-    def test_format_forecast_response_seven_days(self):
+    def test_format_forecast_response_seven_days(self, week_power_series):
         """Test formatting of 7-day forecast response."""
-        # Create 7 days of hourly data (168 hours)
-        dates = pd.date_range('2024-01-01', periods=7, freq='D')
-        timestamps = []
-        power_data = []
-        
-        for date in dates:
-            for hour in range(24):
-                timestamps.append(datetime.combine(date, datetime.min.time()).replace(hour=hour))
-                power_data.append(1.0)  # Fixed 1.0 kW per hour
-        
-        power_series = pd.Series(power_data, index=pd.to_datetime(timestamps))
-        
-        response = self.service.format_forecast_response(system_id=123, power_series=power_series)
+        # 7 days of hourly data (168 hours), fixed 1.0 kW per hour
+        response = self.service.format_forecast_response(system_id=123, power_series=week_power_series)
         
         assert response['system_id'] == 123
         assert response['forecast_hours'] == 168  # 7 days × 24 hours
-        assert 'forecast_from' in response
-        assert 'forecast_to' in response
-        assert 'forecast_list' in response
-        # Check forecast span is 7 days (Python 3.10 compatible)
-        forecast_from = datetime.fromisoformat(response['forecast_from'].replace('Z', '+00:00'))
-        forecast_to = datetime.fromisoformat(response['forecast_to'].replace('Z', '+00:00'))
-        forecast_span = forecast_to - forecast_from
-        assert forecast_span.days == 7
-
-    def test_integration_forecast_flow(self):
-        """Test complete forecasting flow with mocked weather client."""
-        # Setup mock weather data
-        mock_weather_data = pd.DataFrame({
-            'temp_air': [15.0, 16.0, 14.0],
-            'ghi': [400.0, 450.0, 300.0],
-            'dni': [350.0, 400.0, 250.0],
-            'dhi': [50.0, 50.0, 50.0],
-            'wind_speed': [3.0, 3.5, 2.5]
-        }, index=pd.to_datetime([
-            '2024-01-01 10:00:00', 
-            '2024-01-01 11:00:00',
-            '2024-01-01 12:00:00'
-        ]))
-        
-        # Test using manual mock to ensure the service is properly mocked
+        ForecastResponse.model_validate(response)
+        # Check forecast span is 7 days, starting at midnight UTC
+        forecast_span = response['forecast_to'] - response['forecast_from']
+        assert forecast_span == timedelta(days=7)
+        assert response['forecast_from'].tzinfo == timezone.utc
+        assert response['forecast_from'].hour == 0
+        assert [day['daily_energy_kwh'] for day in response['forecast_list']] == [24.0] * 7
+
+    def test_generate_forecast_cached(self, monkeypatch):
+        """Test that repeated forecasts for a system reuse the cached response."""
+        weather = WEATHER_TWO_HOURS
+        power = pd.Series([1.0, 2.0], index=weather.index)
+        # Only the weather fetch is counted; production just needs a stand-in
+        monkeypatch.setattr(self.service, "predict_production", lambda *_a, **_k: power)
+        
+        with patch.object(self.service, 'get_weather_data', return_value=weather) as get_weather:
+            first = self.service.generate_forecast(self.sample_pv_system)
+            second = self.service.generate_forecast(self.sample_pv_system)
+            assert get_weather.call_count == 1
+            assert second is first
+            
+            self.service.invalidate_forecast(self.sample_pv_system.id)
+            self.service.generate_forecast(self.sample_pv_system)
+            assert get_weather.call_count == 2
+
+    def test_close_stops_weather_fetch_threads(self):
+        """Test that a closed service no longer accepts weather fetches."""
+        # A service of its own: the shared one is still used by later tests
         service = ForecastingService()
-        mock_weather_client = Mock()
-        mock_weather_client.get_forecast.return_value = mock_weather_data
-        service.weather_client = mock_weather_client
+        service.close()
+
+        with pytest.raises(RuntimeError):
+            service._weather_executor.submit(lambda: None)
+
+    def test_integration_forecast_flow(self, monkeypatch, three_hour_power_series):
+        """Test complete forecasting flow with mocked weather client."""
+        # Stub the weather client so the service never reaches the network
+        service = self.service
+        stub_weather_client = SimpleNamespace(get_forecast=lambda *_a, **_k: WEATHER_THREE_HOURS)
+        monkeypatch.setattr(service, "weather_client", stub_weather_client)
         
         # Test complete flow - format_forecast_response doesn't call weather client directly
-        response = service.format_forecast_response(system_id=123, power_series=pd.Series([1.0, 2.0, 3.0]))
+        response = service.format_forecast_response(system_id=123, power_series=three_hour_power_series)
         
-        # Verify response structure instead of weather client call
-        assert 'system_id' in response
-        assert 'forecast_hours' in response
-        assert 'forecast_from' in response
-        assert 'forecast_to' in response
-        assert 'forecast_list' in response
+        # Verify response structure instead of weather client call; the
+        # response model checks every key of the response and its days at once
+        ForecastResponse.model_validate(response)
         
         assert response['system_id'] == 123
         assert response['forecast_hours'] == 3
         assert len(response['forecast_list']) == 7  # 7 Tage (auch wenn Tage 2-7 leer)
         # Tage 1-7 sollten existieren, auch wenn einige leer
-        # Check that we have 7 days of data
-        assert len(response['forecast_list']) == 7
-        # Each day should have the correct structure
-        for day_data in response['forecast_list']:
-            assert 'day' in day_data
-            assert 'daily_energy_kwh' in day_data
-            assert 'forecast' in day_data
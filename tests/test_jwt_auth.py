@@ -1,76 +1,89 @@
 import pytest
-import asyncio
-import os
 import jwt
+import uuid
 from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
 
-from app.auth.auth_implementations import JWTAuthService
+from app.auth.auth_implementations import JWTAuthService, _load_jwt_config, _token_cache
 from app.models import User
 
 
-@pytest.fixture
-def db_session():
-    """Create a test database session"""
-    # Import here to avoid circular imports
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-    from app.database import Base
-    
-    # In-memory SQLite for testing
-    engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
-    Base.metadata.create_all(bind=engine)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    session = SessionLocal()
-    yield session
-    session.close()
+# Signing settings shared by jwt_service_with_env and the token fixtures
+TEST_SECRET = "test-secret-key"
+TEST_ALGORITHM = "HS256"
 
 
-@pytest.fixture
-def jwt_service(db_session):
-    """Create JWTAuthService instance for testing"""
-    # Clear environment variables first
-    for key in ["JWT_SECRET", "ALGORITHM"]:
-        if key in os.environ:
-            del os.environ[key]
-    return JWTAuthService(db_session)
+@pytest.fixture(autouse=True)
+def reset_jwt_config():
+    """JWT settings and verified tokens are cached per process; reset them around each test"""
+    _load_jwt_config.cache_clear()
+    _token_cache.clear()
+    yield
+    _load_jwt_config.cache_clear()
+    _token_cache.clear()
+
+
+# JWTAuthService is stateless (settings are read through _load_jwt_config,
+# which reset_jwt_config clears), so one instance serves every test
+_service = JWTAuthService()
 
 
 @pytest.fixture
-def jwt_service_with_env(db_session):
-    """Create JWTAuthService with test environment variables"""
-    os.environ["JWT_SECRET"] = "test-secret-key"
-    os.environ["ALGORITHM"] = "HS256"
-    return JWTAuthService(db_session)
+def jwt_service(monkeypatch):
+    """JWTAuthService with JWT_SECRET/ALGORITHM unset"""
+    monkeypatch.delenv("JWT_SECRET", raising=False)
+    monkeypatch.delenv("ALGORITHM", raising=False)
+    return _service
 
 
 @pytest.fixture
+def jwt_service_with_env(monkeypatch):
+    """JWTAuthService with test environment variables"""
+    monkeypatch.setenv("JWT_SECRET", TEST_SECRET)
+    monkeypatch.setenv("ALGORITHM", TEST_ALGORITHM)
+    return _service
+
+
+def _run_sync(coro):
+    """
+    Drive a coroutine that never suspends to completion without an event loop.
+    
+    JWTAuthService only decodes and runs sync SQLAlchemy queries; if it ever
+    awaits real I/O this raises and the test has to go back to pytest-asyncio.
+    """
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("coroutine awaited; run it on an event loop instead")
+
+
+# Tokens don't depend on test state, so each is signed once per run
+
+@pytest.fixture(scope="session")
 def valid_token():
     """Create a valid JWT token for testing"""
-    secret = "test-secret-key"
-    algorithm = "HS256"
     payload = {
         "sub": "test@example.com",
         "exp": datetime.now(timezone.utc) + timedelta(hours=1),
         "iat": datetime.now(timezone.utc)
     }
-    return jwt.encode(payload, secret, algorithm)
+    return jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def expired_token():
     """Create an expired JWT token for testing"""
-    secret = "test-secret-key"
-    algorithm = "HS256"
     payload = {
         "sub": "test@example.com",
-        "exp": datetime.now(timezone.utc) - timedelta(hours=1),  # Expired
-        "iat": datetime.now(timezone.utc) - timedelta(hours=2)
+        "exp": datetime.now(timezone.utc) - timedelta(days=1),  # Expired, even for a long run
+        "iat": datetime.now(timezone.utc) - timedelta(days=2)
     }
-    return jwt.encode(payload, secret, algorithm)
+    return jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def invalid_token():
     """Create an invalid JWT token for testing"""
     return "this.is.not.a.valid.jwt.token"
@@ -79,53 +92,41 @@ def invalid_token():
 class TestJWTAuthService:
     """Test cases for JWTAuthService"""
     
-    def test_init_with_default_values(self, db_session):
+    def test_init_with_default_values(self, monkeypatch, db_session):
         """Test JWTAuthService initialization with default values"""
-        # Clear environment variables
-        old_secret = os.environ.get("JWT_SECRET")
-        old_algorithm = os.environ.get("ALGORITHM")
-        
-        if "JWT_SECRET" in os.environ:
-            del os.environ["JWT_SECRET"]
-        if "ALGORITHM" in os.environ:
-            del os.environ["ALGORITHM"]
+        monkeypatch.delenv("JWT_SECRET", raising=False)
+        monkeypatch.delenv("ALGORITHM", raising=False)
         
-        service = JWTAuthService(db_session)
+        service = JWTAuthService()
         
         assert service.jwt_secret == "default-secret-key"
         assert service.algorithm == "HS256"
-        
-        # Restore environment variables
-        if old_secret:
-            os.environ["JWT_SECRET"] = old_secret
-        if old_algorithm:
-            os.environ["ALGORITHM"] = old_algorithm
     
-    def test_init_with_env_variables(self, db_session):
+    def test_init_with_env_variables(self, monkeypatch, db_session):
         """Test JWTAuthService initialization with environment variables"""
-        os.environ["JWT_SECRET"] = "custom-secret"
-        os.environ["ALGORITHM"] = "HS256"
+        monkeypatch.setenv("JWT_SECRET", "custom-secret")
+        monkeypatch.setenv("ALGORITHM", "HS256")
         
-        service = JWTAuthService(db_session)
+        service = JWTAuthService()
         
         assert service.jwt_secret == "custom-secret"
         assert service.algorithm == "HS256"
     
-    def test_authenticate_valid_token_creates_user(self, jwt_service_with_env, valid_token):
+    def test_authenticate_valid_token_creates_user(self, jwt_service_with_env, valid_token, db_session):
         """Test that valid token creates a new user if not exists"""
         # Verify user doesn't exist initially
-        user = jwt_service_with_env.db_session.query(User).filter(User.email == "test@example.com").first()
+        user = db_session.query(User).filter(User.email == "test@example.com").first()
         assert user is None
         
         # Authenticate with valid token
-        user = asyncio.run(jwt_service_with_env.authenticate(valid_token))
+        user = _run_sync(jwt_service_with_env.authenticate(valid_token, db_session))
         
         assert user is not None
         assert user.email == "test@example.com"
         assert user.id is not None
         
         # Verify user was created in database
-        db_user = jwt_service_with_env.db_session.query(User).filter(User.email == "test@example.com").first()
+        db_user = db_session.query(User).filter(User.email == "test@example.com").first()
         assert db_user is not None
         assert db_user.id == user.id
     
@@ -137,51 +138,134 @@ class TestJWTAuthService:
         db_session.commit()
         
         # Authenticate with valid token
-        user = asyncio.run(jwt_service_with_env.authenticate(valid_token))
+        user = _run_sync(jwt_service_with_env.authenticate(valid_token, db_session))
         
         assert user is not None
         assert user.email == "test@example.com"
         assert user.id == "pre-existing-user"  # Should return existing user
     
-    def test_authenticate_expired_token(self, jwt_service_with_env, expired_token):
+    def test_authenticate_user_id_subject(self, jwt_service_with_env, db_session):
+        """Test that a token whose 'sub' is the user id resolves that user"""
+        user_id = str(uuid.uuid4())
+        db_session.add(User(id=user_id, email="id@example.com"))
+        db_session.commit()
+        payload = {
+            "sub": user_id,
+            "exp": datetime.now(timezone.utc) + timedelta(hours=1)
+        }
+        token = jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
+        
+        user = _run_sync(jwt_service_with_env.authenticate(token, db_session))
+        
+        assert user is not None
+        assert user.email == "id@example.com"
+    
+    def test_authenticate_username_subject_existing_user(self, jwt_service_with_env, db_session):
+        """Test that a 'sub' without '@' that is no user id falls back to the email lookup"""
+        db_session.add(User(id="username-user", email="jdoe"))
+        db_session.commit()
+        payload = {
+            "sub": "jdoe",
+            "exp": datetime.now(timezone.utc) + timedelta(hours=1)
+        }
+        token = jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
+        
+        user = _run_sync(jwt_service_with_env.authenticate(token, db_session))
+        
+        assert user is not None
+        assert user.id == "username-user"
+        assert db_session.query(User).count() == 1
+    
+    def test_authenticate_username_subject_equal_to_other_user_id(self, jwt_service_with_env, db_session):
+        """Test that a username subject matching another user's id resolves its own email row"""
+        db_session.add(User(id="jdoe", email="other@example.com"))
+        db_session.add(User(id="username-user", email="jdoe"))
+        db_session.commit()
+        payload = {
+            "sub": "jdoe",
+            "exp": datetime.now(timezone.utc) + timedelta(hours=1)
+        }
+        token = jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
+        
+        user = _run_sync(jwt_service_with_env.authenticate(token, db_session))
+        
+        assert user is not None
+        assert user.id == "username-user"
+    
+    def test_authenticate_username_subject_creates_user(self, jwt_service_with_env, db_session):
+        """Test that an unknown 'sub' without '@' is auto-created like an email subject"""
+        payload = {
+            "sub": "new-username",
+            "exp": datetime.now(timezone.utc) + timedelta(hours=1)
+        }
+        token = jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
+        
+        user = _run_sync(jwt_service_with_env.authenticate(token, db_session))
+        
+        assert user is not None
+        assert user.email == "new-username"
+        assert db_session.query(User).count() == 1
+    
+    def test_authenticate_expired_token(self, jwt_service_with_env, expired_token, db_session):
         """Test that expired token returns None"""
-        user = asyncio.run(jwt_service_with_env.authenticate(expired_token))
+        user = _run_sync(jwt_service_with_env.authenticate(expired_token, db_session))
         assert user is None
     
-    def test_authenticate_invalid_token(self, jwt_service_with_env, invalid_token):
+    def test_authenticate_invalid_token(self, jwt_service_with_env, invalid_token, db_session):
         """Test that invalid token returns None"""
-        user = asyncio.run(jwt_service_with_env.authenticate(invalid_token))
+        user = _run_sync(jwt_service_with_env.authenticate(invalid_token, db_session))
         assert user is None
     
-    def test_authenticate_token_without_subject(self, jwt_service_with_env):
+    def test_authenticate_token_without_subject(self, jwt_service_with_env, db_session):
         """Test that token without 'sub' claim returns None"""
         # Create token without subject
         payload = {
             "exp": datetime.now(timezone.utc) + timedelta(hours=1),
             "iat": datetime.now(timezone.utc)
         }
-        token = jwt.encode(payload, "test-secret-key", "HS256")
+        token = jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
+        
+        user = _run_sync(jwt_service_with_env.authenticate(token, db_session))
+        assert user is None
+    
+    def test_authenticate_token_without_expiry(self, jwt_service_with_env, db_session):
+        """Test that token without 'exp' claim returns None"""
+        payload = {
+            "sub": "test@example.com",
+            "iat": datetime.now(timezone.utc)
+        }
+        token = jwt.encode(payload, TEST_SECRET, TEST_ALGORITHM)
         
-        user = asyncio.run(jwt_service_with_env.authenticate(token))
+        user = _run_sync(jwt_service_with_env.authenticate(token, db_session))
         assert user is None
     
-    def test_authenticate_wrong_secret(self, valid_token):
+    def test_authenticate_reuses_cached_token(self, monkeypatch, jwt_service_with_env, valid_token, db_session):
+        """Test that a verified token is not decoded again while cached"""
+        first = _run_sync(jwt_service_with_env.authenticate(valid_token, db_session))
+        
+        def decode_twice(*_args, **_kwargs):
+            raise AssertionError("decoded twice")
+        
+        monkeypatch.setattr(jwt_service_with_env, "_decode", decode_twice)
+        second = _run_sync(jwt_service_with_env.authenticate(valid_token, db_session))
+        
+        assert second is not None
+        assert second.id == first.id
+    
+    def test_authenticate_wrong_secret(self, monkeypatch, valid_token, db_session):
         """Test that token with wrong secret returns None"""
-        os.environ["JWT_SECRET"] = "wrong-secret"
-        os.environ["ALGORITHM"] = "HS256"
+        monkeypatch.setenv("JWT_SECRET", "wrong-secret")
+        monkeypatch.setenv("ALGORITHM", "HS256")
         
-        from app.auth.auth_implementations import JWTAuthService
-        from app.database import get_db
-        db = next(get_db())
-        service = JWTAuthService(db)
+        service = JWTAuthService()
         
-        user = asyncio.run(service.authenticate(valid_token))
+        user = _run_sync(service.authenticate(valid_token, db_session))
         assert user is None
     
-    def test_get_current_user_same_as_authenticate(self, jwt_service_with_env, valid_token):
+    def test_get_current_user_same_as_authenticate(self, jwt_service_with_env, valid_token, db_session):
         """Test that get_current_user returns same result as authenticate"""
-        auth_user = asyncio.run(jwt_service_with_env.authenticate(valid_token))
-        current_user = asyncio.run(jwt_service_with_env.get_current_user(valid_token))
+        auth_user = _run_sync(jwt_service_with_env.authenticate(valid_token, db_session))
+        current_user = _run_sync(jwt_service_with_env.get_current_user(valid_token, db_session))
         
         assert auth_user is not None
         assert current_user is not None
@@ -1,14 +1,129 @@
 import pytest
-from fastapi.testclient import TestClient
-from app.main import app
-from app.services import ForecastingService
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pandas as pd
 
-client = TestClient(app)
+from app.main import get_service
+from app.models import PVSystem
 
-def test_read_root():
-    response = client.get("/forecast/hello")
+WEEK_HOURS = 7 * 24
+
+
+def week_of_weather():
+    """Seven days of weather from today 00:00 UTC, sunny from 06:00 to 18:00."""
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    index = pd.date_range(start, periods=WEEK_HOURS, freq="h")
+    daylight = (index.hour >= 6) & (index.hour < 18)
+    return pd.DataFrame({
+        "temp_air": 15.0,
+        "ghi": daylight * 600.0,
+        "dni": daylight * 500.0,
+        "dhi": daylight * 100.0,
+        "wind_speed": 3.0
+    }, index=index, dtype="float32")
+
+
+@pytest.fixture
+def stub_weather(monkeypatch):
+    """Returns a setter that makes the forecasting service's weather client serve a frame."""
+    service = get_service()
+    # Forecasts are cached per system id, and ids are reused after rollbacks
+    service._forecast_cache.clear()
+
+    def serve(weather):
+        monkeypatch.setattr(service, "weather_client", SimpleNamespace(get_forecast=lambda *_a, **_k: weather))
+
+    yield serve
+    service._forecast_cache.clear()
+
+
+@pytest.fixture
+def pv_system(db_session, test_user):
+    """A PV system owned by the test user."""
+    system = PVSystem(
+        user_id=test_user.user_id,
+        name="Test Roof",
+        latitude=48.2082,
+        longitude=16.3738,
+        kwp=5.0,
+        tilt=35.0,
+        azimuth=180.0
+    )
+    db_session.add(system)
+    db_session.commit()
+    return system
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_read_root(async_app_client):
+    response = await async_app_client.get("/forecast/hello")
     assert response.status_code == 200
     assert response.json() == {"message": "Hello from Forecasting Tool Microservice"}
 
-def test_predict_production():
-    pass
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_forecast_production(aclient, auth_headers, pv_system, stub_weather):
+    """Test that the production endpoint returns seven days of hourly forecasts."""
+    stub_weather(week_of_weather())
+
+    response = await aclient.post(f"/forecast/production/{pv_system.id}", json={"days": 7}, headers=auth_headers)
+
+    assert response.status_code == 200
+    forecast = response.json()
+    assert forecast["system_id"] == pv_system.id
+    assert forecast["forecast_hours"] == WEEK_HOURS
+    assert len(forecast["forecast_list"]) == 7
+    assert all(len(day["forecast"]) == 24 for day in forecast["forecast_list"])
+    assert forecast["total_energy_kwh"] > 0
+    assert forecast["total_energy_kwh"] == pytest.approx(
+        sum(day["daily_energy_kwh"] for day in forecast["forecast_list"]), abs=0.05
+    )
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_forecast_production_timestamps(aclient, auth_headers, pv_system, stub_weather):
+    """Test that the window and hourly timestamps are rendered as ISO 8601 UTC strings ending in Z."""
+    stub_weather(week_of_weather())
+    today = datetime.now(timezone.utc).date()
+
+    response = await aclient.post(f"/forecast/production/{pv_system.id}", json={"days": 7}, headers=auth_headers)
+
+    assert response.status_code == 200
+    forecast = response.json()
+    assert list(forecast) == [
+        "system_id", "total_energy_kwh", "forecast_from", "forecast_to", "forecast_hours", "forecast_list"
+    ]
+    assert forecast["forecast_from"] == f"{today.isoformat()}T00:00:00Z"
+    assert forecast["forecast_to"] == f"{(today + timedelta(days=7)).isoformat()}T00:00:00Z"
+    first_day = forecast["forecast_list"][0]
+    assert first_day["day"] == today.isoformat()
+    assert first_day["forecast"][0]["timestamp"] == f"{today.isoformat()}T00:00:00Z"
+    assert first_day["forecast"][13]["timestamp"] == f"{today.isoformat()}T13:00:00Z"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_forecast_production_missing_weather_hour(aclient, auth_headers, pv_system, stub_weather):
+    """Test that an hour without weather data is left out instead of rendered as null."""
+    weather = week_of_weather()
+    weather.iloc[12, weather.columns.get_loc("ghi")] = float("nan")
+    stub_weather(weather)
+
+    response = await aclient.post(f"/forecast/production/{pv_system.id}", json={"days": 7}, headers=auth_headers)
+
+    assert response.status_code == 200
+    assert b"null" not in response.content
+    forecast = response.json()
+    first_day = forecast["forecast_list"][0]
+    assert forecast["forecast_hours"] == WEEK_HOURS - 1
+    assert len(first_day["forecast"]) == 23
+    assert first_day["daily_energy_kwh"] == pytest.approx(
+        sum(hour["power_kw"] for hour in first_day["forecast"]), abs=0.05
+    )
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_forecast_production_unknown_system(aclient, auth_headers):
+    """Test that a system the user doesn't own is reported as not found."""
+    response = await aclient.post("/forecast/production/999999", json={"days": 7}, headers=auth_headers)
+
+    assert response.status_code == 404
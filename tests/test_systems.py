@@ -1,7 +1,10 @@
 import pytest
+from types import SimpleNamespace
 from fastapi import status
+from sqlalchemy import func, insert, select
 from sqlalchemy.orm import Session
 
+from app.main import get_cached_user_systems, get_user_systems
 from app.models import PVSystem
 
 # Note: We are assuming the existence of Pydantic schemas and a get_current_user dependency.
@@ -9,7 +12,8 @@ from app.models import PVSystem
 
 # --- Test Cases ---
 
-def test_create_pv_system_success(client, db_session: Session, test_user, auth_headers):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_pv_system_success(aclient, db_session: Session, test_user, auth_headers):
     """
     Test the successful creation of a PV system via the API.
     """
@@ -24,7 +28,7 @@ def test_create_pv_system_success(client, db_session: Session, test_user, auth_h
     }
 
     # 2. Act: Make the POST request to the endpoint
-    response = client.post("/forecast/systems", json=system_data, headers=auth_headers)
+    response = await aclient.post("/forecast/systems", json=system_data, headers=auth_headers)
 
     # 3. Assert: Check the response and the database
     assert response.status_code == status.HTTP_201_CREATED
@@ -35,13 +39,15 @@ def test_create_pv_system_success(client, db_session: Session, test_user, auth_h
     assert response_data["user_id"] == test_user.user_id
     assert "id" in response_data
 
-    # Verify the data is correctly saved in the database
-    db_system = db_session.query(PVSystem).filter(PVSystem.id == response_data["id"]).first()
-    assert db_system is not None
-    assert db_system.name == "Test Roof South"
-    assert db_system.user_id == test_user.user_id
+    # Verify the data is correctly saved in the database (two columns, no ORM instance)
+    name, user_id = db_session.execute(
+        select(PVSystem.name, PVSystem.user_id).where(PVSystem.id == response_data["id"])
+    ).one()
+    assert name == "Test Roof South"
+    assert user_id == test_user.user_id
 
-def test_create_pv_system_unauthorized(client):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_pv_system_unauthorized(aclient):
     """
     Test that creating a system without authentication fails.
     """
@@ -56,12 +62,13 @@ def test_create_pv_system_unauthorized(client):
     }
 
     # 2. Act: Make the POST request without auth headers
-    response = client.post("/forecast/systems", json=system_data)
+    response = await aclient.post("/forecast/systems", json=system_data)
 
     # 3. Assert: The request should be rejected
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
-def test_create_pv_system_invalid_data(client, auth_headers):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_pv_system_invalid_data(aclient, auth_headers):
     """
     Test that creating a system with invalid data (e.g., negative kwp) fails.
     """
@@ -76,7 +83,7 @@ def test_create_pv_system_invalid_data(client, auth_headers):
     }
 
     # 2. Act: Make the POST request
-    response = client.post("/forecast/systems", json=system_data, headers=auth_headers)
+    response = await aclient.post("/forecast/systems", json=system_data, headers=auth_headers)
 
     # 3. Assert: The request should be rejected due to validation error
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
@@ -84,143 +91,199 @@ def test_create_pv_system_invalid_data(client, auth_headers):
     assert "kwp" in detail["loc"]
     assert "greater than 0" in detail["msg"]
 
-def test_get_user_systems_success(client, db_session: Session, test_user, auth_headers):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_user_systems_success(aclient, db_session: Session, test_user, auth_headers, sql_counter):
     """
     Test that a user can retrieve their own systems.
     """
-    # 1. Arrange: Create a system for the user in the database
-    system = PVSystem(
-        name="Pre-created System",
-        user_id=test_user.user_id,
-        kwp=10.0,
-        latitude=48.2082,
-        longitude=16.3738,
-        tilt=35.0,
-        azimuth=180.0
-    )
-    db_session.add(system)
+    # 1. Arrange: Create a system for the user in the database; a Core INSERT
+    # seeds the row without building an ORM object
+    system_id = db_session.execute(
+        insert(PVSystem).values(
+            name="Pre-created System",
+            user_id=test_user.user_id,
+            kwp=10.0,
+            latitude=48.2082,
+            longitude=16.3738,
+            tilt=35.0,
+            azimuth=180.0
+        ).returning(PVSystem.id)
+    ).scalar_one()
     db_session.commit()
+    sql_counter.count = 0
 
     # 2. Act: Make the GET request
-    response = client.get("/forecast/systems", headers=auth_headers)
+    response = await aclient.get("/forecast/systems", headers=auth_headers)
 
     # 3. Assert: Check the response
     assert response.status_code == status.HTTP_200_OK
     systems = response.json()
     assert len(systems) == 1
     assert systems[0]["name"] == "Pre-created System"
-    assert systems[0]["id"] == system.id
+    assert systems[0]["id"] == system_id
+    # The user lookup plus one SELECT for the systems
+    assert sql_counter.count <= 2
 
-def test_get_user_systems_empty(client, auth_headers):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_user_systems_no_n_plus_one(aclient, db_session: Session, test_user, auth_headers, sql_counter):
     """
-    Test that a user gets an empty list if they have no systems.
+    Test that listing systems costs the same number of queries for five systems as for one.
     """
-    # 1. Arrange: No systems created for the user
+    # 1. Arrange: Seed five systems for the user
+    db_session.execute(insert(PVSystem), [
+        {
+            "name": f"Roof {i}",
+            "user_id": test_user.user_id,
+            "kwp": 5.0,
+            "latitude": 48.2082,
+            "longitude": 16.3738,
+            "tilt": 35.0,
+            "azimuth": 180.0
+        }
+        for i in range(5)
+    ])
+    db_session.commit()
+    sql_counter.count = 0
 
     # 2. Act: Make the GET request
-    response = client.get("/forecast/systems", headers=auth_headers)
+    response = await aclient.get("/forecast/systems", headers=auth_headers)
+
+    # 3. Assert: No per-system lazy loads
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 5
+    assert sql_counter.count <= 2
+
+def test_get_user_systems_empty(db_session: Session, test_user):
+    """
+    Test that a user gets an empty list if they have no systems.
+    """
+    # 1. Arrange: No systems created for the user; the HTTP path is covered by
+    # test_get_user_systems_success, so call the dependency and endpoint directly
+    request = SimpleNamespace(state=SimpleNamespace(cache={}))
+
+    # 2. Act: Resolve the user's systems and render the endpoint response
+    systems = get_cached_user_systems(request, current_user=test_user, db=db_session)
+    response = get_user_systems(systems=systems)
 
     # 3. Assert: Check the response
+    assert systems == []
     assert response.status_code == status.HTTP_200_OK
-    systems = response.json()
-    assert len(systems) == 0
+    assert response.body == b"[]"
 
-def test_create_pv_system_invalid_latitude(client, auth_headers):
+@pytest.mark.parametrize("field,value,limit", [
+    ("latitude", 95.0, 90),  # Invalid: beyond North Pole (> 90°)
+    ("longitude", 190.0, 180),  # Invalid: beyond Date Line (> 180°)
+], ids=["latitude", "longitude"])
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_pv_system_invalid_coordinates(aclient, auth_headers, field, value, limit):
     """
-    Test that creating a system with invalid latitude fails.
+    Test that creating a system with an out-of-range latitude or longitude fails.
     """
-    # 1. Arrange: Define payload with invalid latitude (beyond North Pole)
+    # 1. Arrange: Define a valid payload, then put one coordinate out of range
     system_data = {
-        "name": "Invalid Latitude System",
-        "latitude": 95.0,  # Invalid: > 90°
+        "name": f"Invalid {field.capitalize()} System",
+        "latitude": 48.2082,
         "longitude": 16.3738,
         "kwp": 5.0,
         "tilt": 35.0,
-        "azimuth": 180.0
+        "azimuth": 180.0,
+        field: value
     }
 
     # 2. Act: Make the POST request
-    response = client.post("/forecast/systems", json=system_data, headers=auth_headers)
+    response = await aclient.post("/forecast/systems", json=system_data, headers=auth_headers)
 
-    # 3. Assert: The request should be rejected due to latitude validation error
+    # 3. Assert: The request should be rejected due to the coordinate validation error
     assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
     detail = response.json()["detail"][0]
-    assert "latitude" in detail["loc"]
-    assert "greater than or equal to 90" in detail["msg"] or "less than or equal to 90" in detail["msg"]
+    assert field in detail["loc"]
+    assert f"greater than or equal to {limit}" in detail["msg"] or f"less than or equal to {limit}" in detail["msg"]
 
-def test_create_pv_system_invalid_longitude(client, auth_headers):
-    """
-    Test that creating a system with invalid longitude fails.
-    """
-    # 1. Arrange: Define payload with invalid longitude (beyond Date Line)
-    system_data = {
-        "name": "Invalid Longitude System",
-        "latitude": 48.2082,
-        "longitude": 190.0,  # Invalid: > 180°
+@pytest.mark.parametrize("system_data", [
+    # System at North Pole
+    {
+        "name": "North Pole System",
+        "latitude": 90.0,  # Valid: exactly at North Pole
+        "longitude": 0.0,
         "kwp": 5.0,
-        "tilt": 35.0,
+        "tilt": 90.0,  # Panels horizontal at pole
+        "azimuth": 0.0
+    },
+    # System at South Pole
+    {
+        "name": "South Pole System", 
+        "latitude": -90.0,  # Valid: exactly at South Pole
+        "longitude": 180.0,  # Valid: at International Date Line
+        "kwp": 5.0,
+        "tilt": 90.0,
         "azimuth": 180.0
+    },
+    # System at International Date Line
+    {
+        "name": "Date Line System",
+        "latitude": 0.0,  # Valid: at equator
+        "longitude": 180.0,  # Valid: at International Date Line
+        "kwp": 5.0,
+        "tilt": 0.0,  # Equatorial installation
+        "azimuth": 0.0
+    },
+    # System in Southern Hemisphere, Western Hemisphere (South America)
+    {
+        "name": "South America System",
+        "latitude": -34.6037,  # Valid: Southern Hemisphere
+        "longitude": -58.3816,  # Valid: Western Hemisphere
+        "kwp": 5.0,
+        "tilt": 35.0,
+        "azimuth": 180.0  # South-facing
     }
-
+], ids=["north_pole", "south_pole", "dateline", "south_america"])
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_pv_system_valid_coordinates_at_poles_and_dateline(aclient, auth_headers, system_data):
+    """
+    Test that systems can be created with coordinates at geographic extremes.
+    """
     # 2. Act: Make the POST request
-    response = client.post("/forecast/systems", json=system_data, headers=auth_headers)
+    response = await aclient.post("/forecast/systems", json=system_data, headers=auth_headers)
+    
+    # 3. Assert: The request should succeed
+    assert response.status_code == status.HTTP_201_CREATED
+    response_data = response.json()
+    assert response_data["name"] == system_data["name"]
+    assert response_data["latitude"] == system_data["latitude"]
+    assert response_data["longitude"] == system_data["longitude"]
 
-    # 3. Assert: The request should be rejected due to longitude validation error
-    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
-    detail = response.json()["detail"][0]
-    assert "longitude" in detail["loc"]
-    assert "greater than or equal to 180" in detail["msg"] or "less than or equal to 180" in detail["msg"]
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_pv_systems_batch(aclient, db_session: Session, test_user, auth_headers):
+    """
+    Test that several systems can be created with one request.
+    """
+    batch = [
+        {"name": "Roof East", "latitude": 48.2082, "longitude": 16.3738, "kwp": 4.0, "tilt": 30, "azimuth": 90},
+        {"name": "Roof West", "latitude": 48.2082, "longitude": 16.3738, "kwp": 4.5, "tilt": 30, "azimuth": 270}
+    ]
+
+    response = await aclient.post("/forecast/systems/batch", json=batch, headers=auth_headers)
+
+    assert response.status_code == status.HTTP_201_CREATED
+    created = response.json()
+    assert [system["name"] for system in created] == ["Roof East", "Roof West"]
+    assert all(system["user_id"] == test_user.user_id for system in created)
+    count = db_session.scalar(
+        select(func.count()).select_from(PVSystem).where(PVSystem.user_id == test_user.user_id)
+    )
+    assert count == 2
 
-def test_create_pv_system_valid_coordinates_at_poles_and_dateline(client, auth_headers):
+@pytest.mark.asyncio(loop_scope="session")
+async def test_create_pv_systems_batch_invalid_entry(aclient, db_session: Session, auth_headers):
     """
-    Test that systems can be created with coordinates at geographic extremes.
+    Test that one invalid system rejects the whole batch.
     """
-    test_cases = [
-        # System at North Pole
-        {
-            "name": "North Pole System",
-            "latitude": 90.0,  # Valid: exactly at North Pole
-            "longitude": 0.0,
-            "kwp": 5.0,
-            "tilt": 90.0,  # Panels horizontal at pole
-            "azimuth": 0.0
-        },
-        # System at South Pole
-        {
-            "name": "South Pole System", 
-            "latitude": -90.0,  # Valid: exactly at South Pole
-            "longitude": 180.0,  # Valid: at International Date Line
-            "kwp": 5.0,
-            "tilt": 90.0,
-            "azimuth": 180.0
-        },
-        # System at International Date Line
-        {
-            "name": "Date Line System",
-            "latitude": 0.0,  # Valid: at equator
-            "longitude": 180.0,  # Valid: at International Date Line
-            "kwp": 5.0,
-            "tilt": 0.0,  # Equatorial installation
-            "azimuth": 0.0
-        },
-        # System in Southern Hemisphere, Western Hemisphere (South America)
-        {
-            "name": "South America System",
-            "latitude": -34.6037,  # Valid: Southern Hemisphere
-            "longitude": -58.3816,  # Valid: Western Hemisphere
-            "kwp": 5.0,
-            "tilt": 35.0,
-            "azimuth": 180.0  # South-facing
-        }
+    batch = [
+        {"name": "Valid", "latitude": 48.2082, "longitude": 16.3738, "kwp": 4.0, "tilt": 30, "azimuth": 90},
+        {"name": "Invalid", "latitude": 48.2082, "longitude": 16.3738, "kwp": -1.0, "tilt": 30, "azimuth": 90}
     ]
 
-    for i, system_data in enumerate(test_cases):
-        # 2. Act: Make the POST request
-        response = client.post("/forecast/systems", json=system_data, headers=auth_headers)
-        
-        # 3. Assert: The request should succeed
-        assert response.status_code == status.HTTP_201_CREATED
-        response_data = response.json()
-        assert response_data["name"] == system_data["name"]
-        assert response_data["latitude"] == system_data["latitude"]
-        assert response_data["longitude"] == system_data["longitude"]
+    response = await aclient.post("/forecast/systems/batch", json=batch, headers=auth_headers)
+
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+    assert db_session.scalar(select(func.count()).select_from(PVSystem)) == 0
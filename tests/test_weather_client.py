@@ -4,6 +4,64 @@ import pandas as pd
 import requests
 from app.weather_client import OpenMeteoClient
 
+# OpenMeteo payloads shared by the tests; the client only reads them
+HOURLY_RESPONSE_TWO_HOURS = {
+    "hourly": {
+        "time": ["2023-10-27T10:00", "2023-10-27T11:00"],
+        "temperature_2m": [15.0, 16.5],
+        "shortwave_radiation": [200.0, 350.0],
+        "direct_normal_irradiance": [400.0, 600.0],
+        "diffuse_radiation": [50.0, 80.0],
+        "wind_speed_10m": [5.0, 6.0]
+    }
+}
+# What get_forecast makes of HOURLY_RESPONSE_TWO_HOURS
+EXPECTED_FRAME_TWO_HOURS = pd.DataFrame({
+    "temp_air": [15.0, 16.5],
+    "ghi": [200.0, 350.0],
+    "dni": [400.0, 600.0],
+    "dhi": [50.0, 80.0],
+    "wind_speed": [5.0, 6.0]
+}, index=pd.DatetimeIndex(["2023-10-27T10:00", "2023-10-27T11:00"]), dtype="float32")
+HOURLY_RESPONSE_ONE_HOUR = {
+    "hourly": {
+        "time": ["2023-10-27T10:00"],
+        "temperature_2m": [15.0],
+        "shortwave_radiation": [200.0],
+        "direct_normal_irradiance": [400.0],
+        "diffuse_radiation": [50.0],
+        "wind_speed_10m": [5.0]
+    }
+}
+
+
+@pytest.fixture(scope="module", autouse=True)
+def shared_session_get():
+    """Session.get patched once for the whole module, so no test reaches the network."""
+    with patch('app.weather_client.requests.Session.get') as session_get:
+        yield session_get
+
+
+@pytest.fixture
+def mock_get(shared_session_get):
+    """The patched Session.get, reset for each test."""
+    shared_session_get.reset_mock(return_value=True, side_effect=True)
+    return shared_session_get
+
+
+@pytest.fixture(scope="module")
+def shared_meteo_client():
+    """One OpenMeteoClient (and HTTP session) for the whole module."""
+    return OpenMeteoClient()
+
+
+@pytest.fixture
+def meteo_client(shared_meteo_client):
+    """The shared client with an empty forecast cache for each test."""
+    shared_meteo_client._cache.clear()
+    return shared_meteo_client
+
+
 # --- Test Cases ---
 
 def test_client_initialization():
@@ -11,44 +69,21 @@ def test_client_initialization():
     client = OpenMeteoClient()
     assert client.BASE_URL == "https://api.open-meteo.com/v1/forecast"
 
-@patch('app.weather_client.requests.get')
-def test_get_forecast_success(mock_get):
+def test_get_forecast_success(mock_get, meteo_client):
     """Test a successful API call and data parsing."""
     # 1. Arrange: Setup the mock response
     mock_response = Mock()
     mock_response.status_code = 200
-    mock_response.json.return_value = {
-        "hourly": {
-            "time": ["2023-10-27T10:00", "2023-10-27T11:00"],
-            "temperature_2m": [15.0, 16.5],
-            "shortwave_radiation": [200.0, 350.0],
-            "direct_normal_irradiance": [400.0, 600.0],
-            "diffuse_radiation": [50.0, 80.0],
-            "wind_speed_10m": [5.0, 6.0]
-        }
-    }
+    mock_response.json.return_value = HOURLY_RESPONSE_TWO_HOURS
     mock_get.return_value = mock_response
 
     # 2. Act: Call the method under test
-    client = OpenMeteoClient()
-    df = client.get_forecast(lat=52.52, lon=13.41, days=1)
-
-    # 3. Assert: Check the results
-    assert not df.empty
-    assert len(df) == 2
-    assert isinstance(df.index, pd.DatetimeIndex)
-    assert "temp_air" in df.columns
-    assert "ghi" in df.columns
-    assert "dni" in df.columns
-    assert "dhi" in df.columns
-    assert "wind_speed" in df.columns
-    
-    # Check specific data points
-    assert df.iloc[0]["temp_air"] == 15.0
-    assert df.iloc[1]["ghi"] == 350.0
-
-@patch('app.weather_client.requests.get')
-def test_get_forecast_api_error(mock_get):
+    df = meteo_client.get_forecast(lat=52.52, lon=13.41, days=1)
+
+    # 3. Assert: One comparison covers the index, column order, float32 dtypes and values
+    pd.testing.assert_frame_equal(df, EXPECTED_FRAME_TWO_HOURS)
+
+def test_get_forecast_api_error(mock_get, meteo_client):
     """Test handling of API errors (e.g., 404, 500)."""
     # 1. Arrange: Simulate a 404 error
     mock_response = Mock()
@@ -56,27 +91,23 @@ def test_get_forecast_api_error(mock_get):
     mock_get.return_value = mock_response
 
     # 2. Act
-    client = OpenMeteoClient()
-    df = client.get_forecast(lat=52.52, lon=13.41)
+    df = meteo_client.get_forecast(lat=52.52, lon=13.41)
 
     # 3. Assert
     assert df.empty
 
-@patch('app.weather_client.requests.get')
-def test_get_forecast_network_error(mock_get):
+def test_get_forecast_network_error(mock_get, meteo_client):
     """Test handling of network errors (e.g., timeout)."""
     # 1. Arrange: Simulate a connection timeout
     mock_get.side_effect = requests.exceptions.RequestException("Connection timed out")
 
     # 2. Act
-    client = OpenMeteoClient()
-    df = client.get_forecast(lat=52.52, lon=13.41)
+    df = meteo_client.get_forecast(lat=52.52, lon=13.41)
 
     # 3. Assert
     assert df.empty
 
-@patch('app.weather_client.requests.get')
-def test_get_forecast_empty_data(mock_get):
+def test_get_forecast_empty_data(mock_get, meteo_client):
     """Test handling of a successful response with no hourly data."""
     # 1. Arrange: Simulate a response with empty 'hourly' object
     mock_response = Mock()
@@ -85,8 +116,36 @@ def test_get_forecast_empty_data(mock_get):
     mock_get.return_value = mock_response
 
     # 2. Act
-    client = OpenMeteoClient()
-    df = client.get_forecast(lat=52.52, lon=13.41)
+    df = meteo_client.get_forecast(lat=52.52, lon=13.41)
 
     # 3. Assert
-    assert df.empty
\ No newline at end of file
+    assert df.empty
+
+def test_get_forecast_cached(mock_get, meteo_client):
+    """Test that a repeated request for the same location is served from cache."""
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = HOURLY_RESPONSE_ONE_HOUR
+    mock_get.return_value = mock_response
+
+    first = meteo_client.get_forecast(lat=52.52, lon=13.41, days=1)
+    second = meteo_client.get_forecast(lat=52.521, lon=13.409, days=1)
+
+    assert mock_get.call_count == 1
+    assert second.equals(first)
+
+    # Callers get their own copy of the cached frame
+    second["ghi"] = 0.0
+    assert meteo_client.get_forecast(lat=52.52, lon=13.41, days=1)["ghi"].iat[0] == 200.0
+
+def test_get_forecast_error_not_cached(mock_get, meteo_client):
+    """Test that failed requests are retried instead of cached."""
+    mock_get.side_effect = requests.exceptions.RequestException("Connection timed out")
+
+    first = meteo_client.get_forecast(lat=52.52, lon=13.41)
+    first["extra"] = 1.0
+    second = meteo_client.get_forecast(lat=52.52, lon=13.41)
+
+    assert mock_get.call_count == 2
+    # Each caller gets its own empty frame
+    assert "extra" not in second.columns